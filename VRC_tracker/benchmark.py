@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from pythonosc import udp_client
+
+from config import ConfigManager
+from modules.data_processor import DataProcessor
+from modules.joycon_ring import JOYCON_SAMPLE_DTYPE
+from modules.latency_tracer import FrameTrace
+from modules.mailbox import Mailbox
+from modules.osc_sender import OSCSender
+from modules.output_filter import OutputFilterBank
+from modules.session_recorder import SessionReader, HANDEDNESS_LABELS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+# mediapipeを読み込むケース。スキップを指定された時と--onlyで選ばれていない時は作らない
+INFERENCE_INPUT_CASES = ("inference_input_full", "inference_input")
+TRACKING_THREAD_CASES = ("tracking_tick", "osc_output_tick")
+FIXTURE_FRAMES = 64 # 合成フィクスチャのフレーム数 (値が毎回変わるように揺らしたものを繰り返し使う)
+JOYCON_SAMPLES_PER_TICK = 3 # 60Hzの出力スレッド1tickあたりに届くIMUサンプル数 (約200Hz)
+
+# --- フィクスチャ (MediaPipeの結果と同じ属性を持つオブジェクト) ---
+
+def _landmark_list(points):
+    if points.shape[1] == 4:
+        landmarks = [SimpleNamespace(x=x, y=y, z=z, visibility=v) for x, y, z, v in points.tolist()]
+    else:
+        landmarks = [SimpleNamespace(x=x, y=y, z=z) for x, y, z in points.tolist()]
+    return SimpleNamespace(landmark=landmarks)
+
+def make_results(hands, handedness, face, pose):
+    """ランドマーク配列からMediaPipeのhands/face_mesh/poseの結果と同じ形のオブジェクトを作る"""
+    hand_results = SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+    if len(hands):
+        hand_results.multi_hand_landmarks = [_landmark_list(points) for points in hands]
+        hand_results.multi_handedness = [
+            SimpleNamespace(classification=[SimpleNamespace(label=label, score=1.0)]) for label in handedness
+        ]
+    face_results = SimpleNamespace(multi_face_landmarks=[_landmark_list(face)] if face is not None else None)
+    pose_results = SimpleNamespace(pose_landmarks=_landmark_list(pose) if pose is not None else None)
+    return hand_results, face_results, pose_results
+
+def synthetic_fixtures(count=FIXTURE_FRAMES, seed=0):
+    """両手・顔・ポーズがすべて検出されているフレームを合成する"""
+    rng = np.random.default_rng(seed)
+    base_hands = rng.uniform(0.2, 0.8, size=(2, 21, 3)).astype(np.float32)
+    base_face = rng.uniform(0.3, 0.7, size=(478, 3)).astype(np.float32)
+    base_pose = rng.uniform(0.1, 0.9, size=(33, 4)).astype(np.float32)
+    base_pose[:, 3] = 0.9
+
+    frames = []
+    for _ in range(count):
+        hands = base_hands + rng.normal(0.0, 0.01, size=base_hands.shape).astype(np.float32)
+        face = base_face + rng.normal(0.0, 0.002, size=base_face.shape).astype(np.float32)
+        pose = base_pose + rng.normal(0.0, 0.005, size=base_pose.shape).astype(np.float32)
+        frames.append(make_results(hands, ("Left", "Right"), face, pose))
+
+    joycon_samples = []
+    for i in range(count):
+        batch = {}
+        for side in ("left", "right"):
+            samples = np.zeros(JOYCON_SAMPLES_PER_TICK, dtype=JOYCON_SAMPLE_DTYPE)
+            samples['timestamp'] = (i * JOYCON_SAMPLES_PER_TICK + np.arange(JOYCON_SAMPLES_PER_TICK)) * 0.005
+            samples['accel'] = rng.normal(0.0, 0.1, size=(JOYCON_SAMPLES_PER_TICK, 3)) + (0.0, 0.0, 1.0)
+            samples['gyro'] = rng.normal(0.0, 30.0, size=(JOYCON_SAMPLES_PER_TICK, 3))
+            samples['buttons'] = i & 0xFFFFFF
+            samples['stick'] = rng.uniform(-1.0, 1.0, size=(JOYCON_SAMPLES_PER_TICK, 2))
+            batch[side] = samples
+        joycon_samples.append(batch)
+    return frames, joycon_samples
+
+def session_fixtures(path):
+    """記録したセッション (main.py --record) をフィクスチャとして使う"""
+    reader = SessionReader(path)
+    frames = []
+    for record in reader.frames:
+        hand_count = int(record['hand_count'])
+        handedness = [HANDEDNESS_LABELS[i] for i in record['handedness'][:hand_count]]
+        frames.append(make_results(
+            record['hands'][:hand_count],
+            handedness,
+            record['face'] if record['face_present'] else None,
+            record['pose'] if record['pose_present'] else None
+        ))
+    joycon_samples = [samples for kind, _, samples in reader.events() if kind == "joycon"]
+    return frames, joycon_samples
+
+# --- 計測 ---
+
+class UDPSink(threading.Thread):
+    """OSCの送信先になるローカルのUDPソケット。受信したパケット数だけ数える"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.2)
+        self.port = self.sock.getsockname()[1]
+        self.packets = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            try:
+                self.sock.recv(65536)
+                self.packets += 1
+            except socket.timeout:
+                pass
+
+    def stop(self):
+        self.running = False
+        self.join()
+        self.sock.close()
+
+def measure(func, iterations, warmup):
+    for i in range(warmup):
+        func(i)
+    durations = np.empty(iterations, dtype=np.int64)
+    for i in range(iterations):
+        start = time.perf_counter_ns()
+        func(i)
+        durations[i] = time.perf_counter_ns() - start
+
+    durations_us = durations / 1000.0
+    p50, p95, p99 = np.percentile(durations_us, [50, 95, 99]).tolist()
+    return {
+        "iterations": iterations,
+        "throughput": iterations / (durations.sum() / 1e9),
+        "mean_us": float(durations_us.mean()),
+        "p50_us": p50,
+        "p95_us": p95,
+        "p99_us": p99,
+    }
+
+# --- ベンチマーク ---
+
+def bench_data_processor(config, frames, joycon_samples):
+    cases = {}
+    data_processor = DataProcessor(config)
+    cases["process_hand_data"] = lambda i: data_processor.process_hand_data(frames[i % len(frames)][0])
+    cases["process_face_data"] = lambda i: data_processor.process_face_data(frames[i % len(frames)][1])
+    cases["process_pose_data"] = lambda i: data_processor.process_pose_data(frames[i % len(frames)][2])
+    if joycon_samples:
+        cases["process_joycon_data"] = lambda i: data_processor.process_joycon_data(joycon_samples[i % len(joycon_samples)])
+    return cases
+
+def bench_osc(config, frames, sink_port):
+    cases = {}
+    data_processor = DataProcessor(config)
+    params_list = []
+    for hand_results, face_results, pose_results in frames:
+        params = {}
+        params.update(data_processor.process_hand_data(hand_results)[0])
+        params.update(data_processor.process_face_data(face_results)[0])
+        params.update(data_processor.process_pose_data(pose_results)[0])
+        params_list.append(params)
+
+    # 全パラメータを毎回バンドルにして送る (エンコード + 送信)
+    bundle_sender = OSCSender("127.0.0.1", sink_port)
+    cases["osc_send_bundle"] = lambda i: bundle_sender.send_bundle(params_list[i % len(params_list)])
+
+    # 設定どおりの量子化・デッドバンドで変化分だけを送る
+    changes_sender = OSCSender(
+        "127.0.0.1", sink_port,
+        quantization_step=config.get_osc_quantization_step(),
+        deadband=config.get_osc_deadband(),
+        deadbands=config.get_osc_deadbands(),
+        keepalive_interval=config.get_osc_keepalive_interval()
+    )
+    cases["osc_send_changes"] = lambda i: changes_sender.send_changes(params_list[i % len(params_list)], now=i / 60.0)
+
+    # 推論結果を観測して、送信時刻まで外挿する (30Hzの推論を60Hzで送信する想定)
+    output_filter = OutputFilterBank(**config.get_output_filter_parameters())
+    def filter_tick(i):
+        params = params_list[i % len(params_list)]
+        if i % 2 == 0:
+            output_filter.observe(params, i / 60.0)
+        return output_filter.apply(params, i / 60.0 + 0.03)
+    cases["output_filter"] = filter_tick
+    return cases
+
+class StubCameraTracker:
+    """フィクスチャを順番に返すCameraTracker。推論は行わない"""
+
+    def __init__(self, frames, **kwargs):
+        self.frames = frames
+        self.index = 0
+        self.frame = np.zeros((480, 640, 3), dtype=np.uint8)
+        self.frame_timestamp = 0.0
+        self.trace = None
+        self.updated_models = {"hands", "face", "pose"}
+
+    def get_landmarks(self):
+        hand_results, face_results, pose_results = self.frames[self.index % len(self.frames)]
+        self.frame_timestamp = time.monotonic()
+        self.trace = FrameTrace(self.index, self.frame_timestamp)
+        self.index += 1
+        return hand_results, face_results, pose_results, self.frame
+
+    def release(self):
+        pass
+
+class StubJoyConManager:
+    def __init__(self, joycon_samples):
+        self.joycon_samples = joycon_samples
+        self.index = 0
+
+    def read_new_samples(self):
+        if not self.joycon_samples:
+            return {}
+        samples = self.joycon_samples[self.index % len(self.joycon_samples)]
+        self.index += 1
+        return samples
+
+    def is_receiving(self, side, now, timeout=1.0):
+        return bool(self.joycon_samples)
+
+    def disconnect(self):
+        pass
+
+def bench_inference_input(config):
+    from modules.camera_tracker import inference_size, prepare_inference_images # mediapipeを読み込むので、このケースを実行する時だけimportする
+
+    capture_format = config.get_camera_capture_format()
+    frame = np.random.default_rng(0).integers(0, 256, size=(capture_format["height"] or 720, capture_format["width"] or 1280, 3), dtype=np.uint8)
+    names = ("hands", "face", "pose")
+    # キャプチャした解像度のまま変換する場合と、設定したモデルごとの幅に縮小してから変換する場合
+    full_sizes = {name: inference_size(frame.shape, 0) for name in names}
+    sizes = {name: inference_size(frame.shape, config.get_inference_width(name)) for name in names}
+    return {
+        "inference_input_full": lambda i: prepare_inference_images(frame, full_sizes),
+        "inference_input": lambda i: prepare_inference_images(frame, sizes),
+    }
+
+def bench_tracking_thread(config, frames, joycon_samples, sink_port):
+    import main # カメラとJoy-Conのモジュールをスタブに差し替えるので、このケースを実行する時だけimportする
+
+    main.CameraTracker = lambda **kwargs: StubCameraTracker(frames, **kwargs)
+    main.JoyConManager = lambda: StubJoyConManager(joycon_samples)
+
+    gui_mailbox = Mailbox()
+    visualizer_mailbox = Mailbox()
+    tracking_thread = main.TrackingThread(config, gui_mailbox, Mailbox(), visualizer_mailbox)
+    tracking_thread.osc_sender.client = udp_client.SimpleUDPClient("127.0.0.1", sink_port)
+
+    def tick(i):
+        tracking_thread._tick()
+        # GUI/Visualizerが毎回受け取ったものとして、次のtickでもプレビューが描画されるようにする
+        gui_mailbox.take()
+        visualizer_mailbox.take()
+
+    return {
+        "tracking_tick": tick,
+        "osc_output_tick": lambda i: tracking_thread.osc_output.publish(),
+    }
+
+# --- ベースラインとの比較 ---
+
+def compare_with_baseline(results, baseline, tolerance):
+    """p95がベースラインよりtolerance以上悪化したケースの名前を返す"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = result["p95_us"] / base["p95_us"] if base["p95_us"] > 0 else 1.0
+        if ratio > 1.0 + tolerance:
+            regressions.append(name)
+        result["baseline_ratio"] = ratio
+    return regressions
+
+def print_results(results, regressions):
+    print(f"{'case':<22}{'ops/s':>12}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'vs base':>10}")
+    for name, result in results.items():
+        ratio = result.get("baseline_ratio")
+        ratio_text = f"{ratio:.2f}x" if ratio is not None else "-"
+        mark = "  REGRESSION" if name in regressions else ""
+        print(f"{name:<22}{result['throughput']:>12.0f}{result['mean_us']:>10.1f}{result['p50_us']:>10.1f}"
+              f"{result['p95_us']:>10.1f}{result['p99_us']:>10.1f}{ratio_text:>10}{mark}")
+    print("(latency in microseconds)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tracking pipeline with synthetic or recorded landmarks.")
+    parser.add_argument("--session", help="Use a session recorded with main.py --record instead of synthetic fixtures")
+    parser.add_argument("--settings", default="VRC_tracker/settings.ini")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--only", nargs="+", metavar="CASE", help="Run only the named cases")
+    parser.add_argument("--skip-tracking-thread", action="store_true", help="Skip the TrackingThread cases")
+    parser.add_argument("--skip-inference-input", action="store_true", help="Skip the inference input preparation cases")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 slowdown against the baseline (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    config = ConfigManager(args.settings)
+    if args.session:
+        frames, joycon_samples = session_fixtures(args.session)
+        if not frames:
+            print(f"No frames in {args.session}")
+            return 1
+    else:
+        frames, joycon_samples = synthetic_fixtures()
+
+    sink = UDPSink()
+    sink.start()
+
+    cases = {}
+    cases.update(bench_data_processor(config, frames, joycon_samples))
+    cases.update(bench_osc(config, frames, sink.port))
+    wanted = lambda names: not args.only or any(name in args.only for name in names)
+    try:
+        if not args.skip_inference_input and wanted(INFERENCE_INPUT_CASES):
+            cases.update(bench_inference_input(config))
+        if not args.skip_tracking_thread and wanted(TRACKING_THREAD_CASES):
+            cases.update(bench_tracking_thread(config, frames, joycon_samples, sink.port))
+    except ImportError as e:
+        print(f"Skipping the cases that need MediaPipe ({e}). Use --skip-inference-input --skip-tracking-thread to hide this message.")
+    if args.only:
+        cases = {name: func for name, func in cases.items() if name in args.only}
+
+    results = {}
+    for name, func in cases.items():
+        results[name] = measure(func, args.iterations, args.warmup)
+    sink.stop()
+
+    regressions = []
+    has_baseline = os.path.exists(args.baseline)
+    if has_baseline and not args.save_baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(results, json.load(baseline_file), args.tolerance)
+
+    print_results(results, regressions)
+    print(f"UDP sink received {sink.packets} packets")
+    if not has_baseline and not args.save_baseline:
+        # ベースラインは計測したマシンに依存するのでリポジトリには含めない
+        print(f"No baseline at {args.baseline}; run with --save-baseline first to fill in the 'vs base' column.")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif regressions:
+        print(f"p95 regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
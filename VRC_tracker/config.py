@@ -1,18 +1,115 @@
 import configparser
+import threading
+from dataclasses import dataclass
+import numpy as np
+
+FINGER_NAMES = ("thumb", "index", "middle", "ring", "pinky")
+ARM_PARAMETER_PARTS = ("shoulder_x", "shoulder_y", "shoulder_z", "elbow_bend")
+CAPTURE_FORMAT_KEYS = ("fourcc", "width", "height", "fps", "buffer_size") # [Camera]のキャプチャの形式の項目
+
+def _frozen_array(values):
+    array = np.array(values, dtype=np.float32)
+    array.flags.writeable = False
+    return array
+
+@dataclass(frozen=True, eq=False)
+class TrackingSettings:
+    """毎フレーム参照する設定値の不変スナップショット。閾値は計算にそのまま使える配列にしておく"""
+    curl_open_y_diff: np.ndarray # (5,) 親指, 人差し指, 中指, 薬指, 小指
+    curl_closed_y_diff: np.ndarray # (5,)
+    gesture_fist_threshold: float
+    gesture_open_threshold: float
+    face_open_thresholds: np.ndarray # (3,) 左目, 右目, 口
+    face_closed_thresholds: np.ndarray # (3,)
+    gyro_sensitivity: float
+    imu_accel_gain: float # Joy-Conの姿勢を重力の向きに寄せる強さ [rad/s]。0で補正しない
+    arm_osc_parameters: tuple # (左, 右) それぞれ (肩X, 肩Y, 肩Z, 肘) のOSCアドレス
 
 class ConfigManager:
     def __init__(self, settings_path='settings.ini'):
         self.settings_path = settings_path
         self.config = configparser.ConfigParser()
+        # GUIスレッドが設定を書き換えている途中にスナップショットを作らないようにする
+        self.lock = threading.RLock()
+        self.snapshot = None
         self.load_config()
 
     def load_config(self):
-        self.config.read(self.settings_path)
+        with self.lock:
+            self.config.read(self.settings_path)
+            self.apply_snapshot()
+
+    def build_snapshot(self):
+        """現在の設定を検証し、TrackingSettingsにまとめる。不正な値があればValueErrorを送出する"""
+        with self.lock:
+            curl_thresholds = [self.get_hand_curl_thresholds(name) for name in FINGER_NAMES]
+            fist_threshold, open_threshold = self.get_gesture_thresholds()
+            eye_open, eye_closed = self.get_eye_thresholds()
+            mouth_open, mouth_closed = self.get_mouth_thresholds()
+            gyro_sensitivity = self.get_gyro_sensitivity()
+            imu_accel_gain = self.get_imu_accel_gain()
+            capture_format = self.get_camera_capture_format()
+            arm_osc_parameters = tuple(
+                tuple(self.get_arm_osc_parameter(f"{side}_{part}_param") for part in ARM_PARAMETER_PARTS)
+                for side in ("left", "right")
+            )
+
+        for name, (open_val, closed_val) in zip(FINGER_NAMES, curl_thresholds):
+            if open_val <= closed_val:
+                raise ValueError(f"{name}_curl_open_y_diff must be greater than {name}_curl_closed_y_diff")
+        if eye_open <= eye_closed:
+            raise ValueError("eye_open_threshold must be greater than eye_closed_threshold")
+        if mouth_open <= mouth_closed:
+            raise ValueError("mouth_open_threshold must be greater than mouth_closed_threshold")
+        if open_threshold > fist_threshold:
+            raise ValueError("gesture_open_threshold must not be greater than gesture_fist_threshold")
+        if imu_accel_gain < 0:
+            raise ValueError("accel_correction_gain must not be negative")
+        if capture_format["fourcc"] and len(capture_format["fourcc"]) != 4:
+            raise ValueError("fourcc must be 4 characters (e.g. MJPG)")
+
+        return TrackingSettings(
+            curl_open_y_diff=_frozen_array([open_val for open_val, _ in curl_thresholds]),
+            curl_closed_y_diff=_frozen_array([closed_val for _, closed_val in curl_thresholds]),
+            gesture_fist_threshold=fist_threshold,
+            gesture_open_threshold=open_threshold,
+            face_open_thresholds=_frozen_array([eye_open, eye_open, mouth_open]),
+            face_closed_thresholds=_frozen_array([eye_closed, eye_closed, mouth_closed]),
+            gyro_sensitivity=gyro_sensitivity,
+            imu_accel_gain=imu_accel_gain,
+            arm_osc_parameters=arm_osc_parameters
+        )
+
+    def apply_snapshot(self):
+        # 参照の差し替えだけなので、読み取り側はロック無しで常に一貫したスナップショットを得られる
+        self.snapshot = self.build_snapshot()
+        return self.snapshot
+
+    def as_dict(self):
+        """設定全体を {(セクション, キー): 値} にする。再設定時に前回との差分を取るのに使う"""
+        with self.lock:
+            return {(section, key): value for section in self.config.sections() for key, value in self.config.items(section)}
+
+    def copy_config(self):
+        """現在の設定のコピー。書き換えた値が検証に通らなかった時にrestore_configで元に戻す"""
+        with self.lock:
+            backup = configparser.ConfigParser()
+            backup.read_dict({section: dict(self.config.items(section, raw=True)) for section in self.config.sections()})
+            return backup
+
+    def restore_config(self, backup):
+        with self.lock:
+            self.config = backup
 
     def save_config(self):
         with open(self.settings_path, 'w') as configfile:
             self.config.write(configfile)
 
+    def _ensure_section(self, section):
+        # 古いsettings.iniには後から追加したセクションが無いことがある
+        if not self.config.has_section(section):
+            self.config.add_section(section)
+
     def get_osc_host(self):
         return self.config.get('OSC', 'host', fallback='127.0.0.1')
 
@@ -25,12 +122,84 @@ class ConfigManager:
     def set_osc_port(self, value):
         self.config.set('OSC', 'port', str(value))
 
+    # OSC Output Settings
+    def get_osc_output_rate(self):
+        return self.config.getfloat('OSCOutput', 'rate', fallback=60.0)
+
+    def set_osc_output_rate(self, value):
+        self._ensure_section('OSCOutput')
+        self.config.set('OSCOutput', 'rate', str(value))
+
+    def get_osc_quantization_step(self):
+        return self.config.getfloat('OSCOutput', 'quantization_step', fallback=0.0)
+
+    def set_osc_quantization_step(self, value):
+        self._ensure_section('OSCOutput')
+        self.config.set('OSCOutput', 'quantization_step', str(value))
+
+    def get_osc_deadband(self):
+        return self.config.getfloat('OSCOutput', 'deadband', fallback=0.0)
+
+    def set_osc_deadband(self, value):
+        self._ensure_section('OSCOutput')
+        self.config.set('OSCOutput', 'deadband', str(value))
+
+    def get_osc_keepalive_interval(self):
+        return self.config.getfloat('OSCOutput', 'keepalive_interval', fallback=1.0)
+
+    def set_osc_keepalive_interval(self, value):
+        self._ensure_section('OSCOutput')
+        self.config.set('OSCOutput', 'keepalive_interval', str(value))
+
+    def get_osc_deadbands(self):
+        # パラメータごとのデッドバンド (キーはパラメータ名かアドレス全体)
+        if not self.config.has_section('OSCDeadband'):
+            return {}
+        return {key: self.config.getfloat('OSCDeadband', key) for key in self.config.options('OSCDeadband')}
+
+    def set_osc_deadband_for(self, param_name, value):
+        self._ensure_section('OSCDeadband')
+        self.config.set('OSCDeadband', param_name, str(value))
+
     def get_camera_device_id(self):
         return self.config.getint('Camera', 'device_id', fallback=0)
 
     def set_camera_device_id(self, value):
         self.config.set('Camera', 'device_id', str(value))
 
+    def get_camera_extra_device_ids(self):
+        # 追加で使うカメラのID (カンマ区切り)。空ならdevice_idのカメラだけを使う
+        value = self.config.get('Camera', 'extra_device_ids', fallback='')
+        return [int(device_id) for device_id in value.split(',') if device_id.strip()]
+
+    def set_camera_extra_device_ids(self, device_ids):
+        self.config.set('Camera', 'extra_device_ids', ','.join(str(device_id) for device_id in device_ids))
+
+    def get_camera_capture_format(self):
+        # キャプチャの形式。空や0の項目はカメラの既定のまま
+        return {
+            "fourcc": self.config.get('Camera', 'fourcc', fallback='').strip(),
+            "width": self.config.getint('Camera', 'width', fallback=0),
+            "height": self.config.getint('Camera', 'height', fallback=0),
+            "fps": self.config.getfloat('Camera', 'fps', fallback=0.0),
+            "buffer_size": self.config.getint('Camera', 'buffer_size', fallback=1),
+        }
+
+    def set_camera_capture_format_value(self, key, value):
+        self.config.set('Camera', key, str(value))
+
+    def get_camera_probe_range(self):
+        return self.config.getint('Camera', 'probe_range', fallback=5)
+
+    def set_camera_probe_range(self, value):
+        self.config.set('Camera', 'probe_range', str(value))
+
+    def get_camera_probe_timeout(self):
+        return self.config.getfloat('Camera', 'probe_timeout', fallback=3.0)
+
+    def set_camera_probe_timeout(self, value):
+        self.config.set('Camera', 'probe_timeout', str(value))
+
     # Hand Tracking Settings
     def get_hand_curl_thresholds(self, finger_name):
         open_key = f"{finger_name}_curl_open_y_diff"
@@ -82,6 +251,12 @@ class ConfigManager:
     def set_gyro_sensitivity(self, value):
         self.config.set('JoyConTracking', 'gyro_sensitivity', str(value))
 
+    def get_imu_accel_gain(self):
+        return self.config.getfloat('JoyConTracking', 'accel_correction_gain', fallback=0.5)
+
+    def set_imu_accel_gain(self, value):
+        self.config.set('JoyConTracking', 'accel_correction_gain', str(value))
+
     # Pose Tracking Settings
     def get_pose_min_detection_confidence(self):
         return self.config.getfloat('PoseTracking', 'min_detection_confidence', fallback=0.5)
@@ -101,3 +276,108 @@ class ConfigManager:
 
     def set_arm_osc_parameter(self, param_name, value):
         self.config.set('ArmOSCParameters', param_name, value)
+
+
+    # Preview Settings
+    def get_preview_fps(self):
+        # GUIのプレビューを描画して送るフレームレートの上限 (トラッキングには影響しない)
+        return max(self.config.getfloat('Preview', 'fps', fallback=10.0), 1.0)
+
+    def set_preview_fps(self, value):
+        self._ensure_section('Preview')
+        self.config.set('Preview', 'fps', str(value))
+
+    # Output Filter Settings
+    def get_output_filter_enabled(self):
+        return self.config.getboolean('OutputFilter', 'enabled', fallback=True)
+
+    def set_output_filter_enabled(self, value):
+        self._ensure_section('OutputFilter')
+        self.config.set('OutputFilter', 'enabled', str(value).lower())
+
+    def get_output_filter_parameters(self):
+        return {
+            "min_cutoff": self.config.getfloat('OutputFilter', 'min_cutoff', fallback=1.0),
+            "beta": self.config.getfloat('OutputFilter', 'beta', fallback=5.0),
+            "d_cutoff": self.config.getfloat('OutputFilter', 'd_cutoff', fallback=1.0),
+            "max_prediction": self.config.getfloat('OutputFilter', 'max_prediction', fallback=0.1),
+        }
+
+    def set_output_filter_parameter(self, name, value):
+        self._ensure_section('OutputFilter')
+        self.config.set('OutputFilter', name, str(value))
+
+    # Inference Settings
+    def get_parallel_inference(self):
+        return self.config.getboolean('Inference', 'parallel', fallback=True)
+
+    def set_parallel_inference(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'parallel', str(value).lower())
+
+    def get_inference_rate(self, model_name):
+        # 0は毎フレーム推論する
+        return self.config.getfloat('Inference', f"{model_name}_rate", fallback=0.0)
+
+    def get_inference_width(self, model_name):
+        # 推論に使う画像の幅 (高さは縦横比を保って決める)。0はキャプチャした解像度のまま
+        return self.config.getint('Inference', f"{model_name}_width", fallback=0)
+
+    def set_inference_width(self, model_name, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', f"{model_name}_width", str(value))
+
+    def set_inference_rate(self, model_name, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', f"{model_name}_rate", str(value))
+
+    def get_motion_gate_enabled(self):
+        return self.config.getboolean('Inference', 'motion_gate', fallback=False)
+
+    def set_motion_gate_enabled(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'motion_gate', str(value).lower())
+
+    def get_motion_threshold(self):
+        return self.config.getfloat('Inference', 'motion_threshold', fallback=6.0)
+
+    def set_motion_threshold(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'motion_threshold', str(value))
+
+    def get_motion_max_skip(self):
+        return self.config.getfloat('Inference', 'motion_max_skip', fallback=0.5)
+
+    def set_motion_max_skip(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'motion_max_skip', str(value))
+
+    def get_idle_timeout(self):
+        return self.config.getfloat('Inference', 'idle_timeout', fallback=10.0)
+
+    def set_idle_timeout(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'idle_timeout', str(value))
+
+    def get_idle_refresh_interval(self):
+        return self.config.getfloat('Inference', 'idle_refresh_interval', fallback=2.0)
+
+    def set_idle_refresh_interval(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'idle_refresh_interval', str(value))
+
+    def get_inference_worker_enabled(self):
+        return self.config.getboolean('Inference', 'worker_process', fallback=False)
+
+    def set_inference_worker_enabled(self, value):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'worker_process', str(value).lower())
+
+    def get_inference_worker_cpus(self):
+        # 推論ワーカーを固定するCPU番号 (カンマ区切り)。空なら固定しない
+        value = self.config.get('Inference', 'worker_cpus', fallback='')
+        return [int(cpu) for cpu in value.split(',') if cpu.strip()]
+
+    def set_inference_worker_cpus(self, cpus):
+        self._ensure_section('Inference')
+        self.config.set('Inference', 'worker_cpus', ','.join(str(cpu) for cpu in cpus))
@@ -1,22 +1,20 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import queue
-import cv2
+from tkinter import ttk, messagebox, filedialog
 from PIL import Image, ImageTk
 
 class GUI(tk.Tk):
-    def __init__(self, config_manager, data_queue, command_queue):
+    def __init__(self, config_manager, data_mailbox, command_mailbox):
         super().__init__()
         self.title("VRC_traker Settings")
         self.geometry("800x600")
 
         self.config_manager = config_manager
-        self.data_queue = data_queue
-        self.command_queue = command_queue
+        self.data_mailbox = data_mailbox
+        self.command_mailbox = command_mailbox
 
         self.create_widgets()
         self.load_settings_to_gui()
-        self.after(100, self.update_gui_from_queue)
+        self.after(self._poll_interval(), self.update_gui_from_mailbox)
 
     def create_widgets(self):
         self.notebook = ttk.Notebook(self)
@@ -30,6 +28,13 @@ class GUI(tk.Tk):
         self.notebook.add(self.info_frame, text="Real-time Info")
         self.create_info_tab(self.info_frame)
 
+        # プレビュータブが表示されている時だけトラッキングスレッドにプレビュー描画をさせる
+        self.notebook.bind("<<NotebookTabChanged>>", self.on_tab_changed)
+
+    def on_tab_changed(self, event):
+        preview_visible = self.notebook.select() == str(self.info_frame)
+        self.send_command({"type": "PREVIEW_VISIBILITY", "visible": preview_visible})
+
     def create_settings_tab(self, parent_frame):
         # OSC Settings
         osc_group = ttk.LabelFrame(parent_frame, text="OSC Settings")
@@ -74,6 +79,9 @@ class GUI(tk.Tk):
         tk.Label(joycon_group, text="Gyro Sensitivity:").grid(row=0, column=0, padx=5, pady=2, sticky="w")
         self.gyro_sensitivity_entry = tk.Entry(joycon_group)
         self.gyro_sensitivity_entry.grid(row=0, column=1, padx=5, pady=2, sticky="ew")
+        tk.Label(joycon_group, text="Accel Correction Gain:").grid(row=1, column=0, padx=5, pady=2, sticky="w")
+        self.imu_accel_gain_entry = tk.Entry(joycon_group)
+        self.imu_accel_gain_entry.grid(row=1, column=1, padx=5, pady=2, sticky="ew")
 
         # Pose Tracking Settings
         pose_group = ttk.LabelFrame(parent_frame, text="Pose Tracking Settings")
@@ -110,6 +118,9 @@ class GUI(tk.Tk):
         # カメラプレビュー
         self.camera_canvas = tk.Canvas(parent_frame, bg="black", width=640, height=480)
         self.camera_canvas.pack(pady=10)
+        # 画像アイテムは1つだけ作り、PhotoImageの中身を書き換えて使い回す
+        self.camera_photo = None
+        self.camera_image_item = self.camera_canvas.create_image(0, 0, anchor=tk.NW)
 
         # Joy-Con接続状態表示
         joycon_status_frame = ttk.LabelFrame(parent_frame, text="Joy-Con Connection Status")
@@ -118,6 +129,18 @@ class GUI(tk.Tk):
         self.left_joycon_status_label.pack(anchor="w")
         self.right_joycon_status_label = tk.Label(joycon_status_frame, text="Right Joy-Con: Disconnected", fg="red")
         self.right_joycon_status_label.pack(anchor="w")
+        # 今の持ち方を正面 (ヨー・ピッチ・ロール0) にする
+        ttk.Button(joycon_status_frame, text="Recenter", command=lambda: self.send_command({"type": "RECENTER_JOYCON"})).pack(anchor="e", padx=5, pady=2)
+
+        # 区間ごとのレイテンシ (キャプチャ -> 推論 -> 処理 -> 送信)
+        latency_group = ttk.LabelFrame(parent_frame, text="Latency (ms)")
+        latency_group.pack(padx=10, pady=5, fill="x")
+        self.latency_text = tk.Text(latency_group, wrap="none", height=9, state="disabled", font=("Courier", 9))
+        self.latency_text.pack(fill="x")
+        latency_button_frame = ttk.Frame(latency_group)
+        latency_button_frame.pack(anchor="e")
+        ttk.Button(latency_button_frame, text="Dump to File...", command=self.dump_latency).pack(side="left", padx=5, pady=2)
+        ttk.Button(latency_button_frame, text="Reset", command=lambda: self.send_command({"type": "RESET_LATENCY"})).pack(side="left", padx=5, pady=2)
 
         # トラッキング情報表示エリア
         info_group = ttk.LabelFrame(parent_frame, text="Tracking Information")
@@ -154,6 +177,8 @@ class GUI(tk.Tk):
         # Joy-Con Tracking
         self.gyro_sensitivity_entry.delete(0, tk.END)
         self.gyro_sensitivity_entry.insert(0, self.config_manager.get_gyro_sensitivity())
+        self.imu_accel_gain_entry.delete(0, tk.END)
+        self.imu_accel_gain_entry.insert(0, self.config_manager.get_imu_accel_gain())
 
         # Pose Tracking
         self.pose_min_detection_confidence_entry.delete(0, tk.END)
@@ -162,72 +187,100 @@ class GUI(tk.Tk):
         self.pose_min_tracking_confidence_entry.insert(0, self.config_manager.get_pose_min_tracking_confidence())
 
     def apply_settings(self):
+        """GUIの値を検証して設定に反映する。検証に通らなければ設定を元に戻してFalseを返す"""
         try:
-            # OSC
-            self.config_manager.set_osc_host(self.osc_host_entry.get())
-            self.config_manager.set_osc_port(int(self.osc_port_entry.get()))
-
-            # Camera
-            self.config_manager.set_camera_device_id(int(self.camera_id_entry.get()))
-
-            # Hand Tracking
-            self.config_manager.set_gesture_thresholds(
-                float(self.hand_fist_threshold_entry.get()),
-                float(self.hand_open_threshold_entry.get())
-            )
-
-            # Face Tracking
-            self.config_manager.set_eye_thresholds(
-                float(self.eye_open_threshold_entry.get()),
-                float(self.eye_closed_threshold_entry.get())
-            )
-            self.config_manager.set_mouth_thresholds(
-                self.config_manager.get_mouth_thresholds()[0],
-                self.config_manager.get_mouth_thresholds()[1]
-            )
-
-            # Joy-Con Tracking
-            self.config_manager.set_gyro_sensitivity(float(self.gyro_sensitivity_entry.get()))
-
-            # Pose Tracking
-            self.config_manager.set_pose_min_detection_confidence(float(self.pose_min_detection_confidence_entry.get()))
-            self.config_manager.set_pose_min_tracking_confidence(float(self.pose_min_tracking_confidence_entry.get()))
-
-            self.command_queue.put({"type": "APPLY_SETTINGS"})
+            with self.config_manager.lock:
+                backup = self.config_manager.copy_config()
+                try:
+                    self._write_settings_from_gui()
+                    # 検証済みのスナップショットを作る。不正な値ならValueErrorになる
+                    self.config_manager.apply_snapshot()
+                except Exception:
+                    # 不正な値を設定に残さない (後で保存した時にsettings.iniへ書き込まれないようにする)
+                    self.config_manager.restore_config(backup)
+                    raise
+
+            self.send_command({"type": "APPLY_SETTINGS"})
             messagebox.showinfo("Settings", "Settings applied successfully! (Not yet saved to file)")
+            return True
 
         except ValueError as e:
             messagebox.showerror("Input Error", f"Invalid input: {e}")
         except Exception as e:
             messagebox.showerror("Error", f"An unexpected error occurred: {e}")
+        return False
+
+    def _write_settings_from_gui(self):
+        # OSC
+        self.config_manager.set_osc_host(self.osc_host_entry.get())
+        self.config_manager.set_osc_port(int(self.osc_port_entry.get()))
+
+        # Camera
+        self.config_manager.set_camera_device_id(int(self.camera_id_entry.get()))
+
+        # Hand Tracking
+        self.config_manager.set_gesture_thresholds(
+            float(self.hand_fist_threshold_entry.get()),
+            float(self.hand_open_threshold_entry.get())
+        )
+
+        # Face Tracking
+        self.config_manager.set_eye_thresholds(
+            float(self.eye_open_threshold_entry.get()),
+            float(self.eye_closed_threshold_entry.get())
+        )
+        self.config_manager.set_mouth_thresholds(
+            self.config_manager.get_mouth_thresholds()[0],
+            self.config_manager.get_mouth_thresholds()[1]
+        )
+
+        # Joy-Con Tracking
+        self.config_manager.set_gyro_sensitivity(float(self.gyro_sensitivity_entry.get()))
+        self.config_manager.set_imu_accel_gain(float(self.imu_accel_gain_entry.get()))
+
+        # Pose Tracking
+        self.config_manager.set_pose_min_detection_confidence(float(self.pose_min_detection_confidence_entry.get()))
+        self.config_manager.set_pose_min_tracking_confidence(float(self.pose_min_tracking_confidence_entry.get()))
 
     def save_settings(self):
-        self.apply_settings()
+        if not self.apply_settings():
+            return
         self.config_manager.save_config()
         messagebox.showinfo("Settings", "Settings saved to file!")
 
-    def update_gui_from_queue(self):
+    def dump_latency(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON", "*.json")], initialfile="latency.json")
+        if path:
+            self.send_command({"type": "DUMP_LATENCY", "path": path})
+
+    def send_command(self, command):
+        # 同じ種類のコマンドはトラッキングスレッドが読む前に上書きされ、最新のものだけが処理される
+        self.command_mailbox.put(command["type"], command)
+
+    def _poll_interval(self):
+        # プレビューのフレームレートより遅く読むとプレビューが間引かれるので、それに合わせて読む (最長100ms)
+        return min(100, int(1000 / self.config_manager.get_preview_fps()))
+
+    def update_gui_from_mailbox(self):
         try:
-            while True:
-                data = self.data_queue.get_nowait()
-                if data["type"] == "TRACKING_DATA":
-                    self.update_info_display(data["info"])
-                    if "frame" in data:
-                        self.update_camera_preview(data["frame"])
-                    self.update_joycon_status_display(data["info"].get("joycon_connected", []))
-                elif data["type"] == "OSC_SENT":
-                    pass
-        except queue.Empty:
-            pass
+            updates = self.data_mailbox.take()
+            if "info" in updates:
+                self.update_info_display(updates["info"])
+                self.update_joycon_status_display(updates["info"].get("joycon_connected", []))
+            if "frame" in updates:
+                self.update_camera_preview(updates["frame"])
+            if "latency" in updates:
+                self.update_latency_display(updates["latency"], updates.get("mailboxes"))
         finally:
-            self.after(100, self.update_gui_from_queue)
+            self.after(self._poll_interval(), self.update_gui_from_mailbox)
 
     def update_camera_preview(self, frame):
-        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        image = Image.fromarray(image)
-        image = image.resize((640, 480), Image.LANCZOS)
-        self.photo = ImageTk.PhotoImage(image=image)
-        self.camera_canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)
+        # フレームはトラッキングスレッドで縮小・RGB変換済み
+        image = Image.fromarray(frame)
+        if self.camera_photo is None or (self.camera_photo.width(), self.camera_photo.height()) != image.size:
+            self.camera_photo = ImageTk.PhotoImage(image.mode, image.size)
+            self.camera_canvas.itemconfig(self.camera_image_item, image=self.camera_photo)
+        self.camera_photo.paste(image)
 
     def update_info_display(self, info):
         self.info_text.config(state="normal")
@@ -281,4 +334,19 @@ class GUI(tk.Tk):
         if "Right" in connected_joycons:
             self.right_joycon_status_label.config(text="Right Joy-Con: Connected", fg="green")
         else:
-            self.right_joycon_status_label.config(text="Right Joy-Con: Disconnected", fg="red")
\ No newline at end of file
+            self.right_joycon_status_label.config(text="Right Joy-Con: Disconnected", fg="red")
+
+    def update_latency_display(self, latency, mailboxes=None):
+        display_str = f"{'stage':<16}{'count':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}\n"
+        for stage, stats in latency.items():
+            display_str += (f"{stage:<16}{stats['count']:>8}{stats['p50']:>8.2f}{stats['p95']:>8.2f}"
+                            f"{stats['p99']:>8.2f}{stats['max']:>8.2f}\n")
+        # 読まれる前に上書きされたデータの数 (GUI/Visualizerの処理が追いついていない目安)
+        for name, stats in (mailboxes or {}).items():
+            dropped = ", ".join(f"{key} {count}" for key, count in stats["dropped"].items()) or "0"
+            display_str += f"{name + ' dropped':<16}{dropped}\n"
+
+        self.latency_text.config(state="normal")
+        self.latency_text.delete(1.0, tk.END)
+        self.latency_text.insert(tk.END, display_str)
+        self.latency_text.config(state="disabled")
\ No newline at end of file
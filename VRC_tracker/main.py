@@ -1,155 +1,370 @@
+import argparse
 import time
 import threading
-import queue
-import cv2
 
-from config import ConfigManager
+from config import ConfigManager, CAPTURE_FORMAT_KEYS
 from modules.camera_tracker import CameraTracker
+from modules.inference_worker import RemoteCameraTracker
+from modules.multi_camera import MultiCameraTracker
+from modules.camera_probe import CameraProbe
+from modules.motion_detector import MotionDetector
 from modules.joycon_manager import JoyConManager
 from modules.data_processor import DataProcessor
 from modules.osc_sender import OSCSender
-from gui import GUI
-from visualizer import VisualizerThread
+from modules.osc_output import OSCOutputThread
+from modules.output_filter import OutputFilterBank
+from modules.latency_tracer import LatencyTracer
+from modules.session_recorder import SessionRecorder
+from modules.mailbox import Mailbox
+# GUI (tkinter/PIL)、Visualizer (pyglet)、プレビュー描画 (mediapipeの描画ユーティリティ) は使う時だけimportする
 
 class TrackingThread(threading.Thread):
-    def __init__(self, config_manager, gui_data_queue, gui_command_queue, visualizer_data_queue):
+    def __init__(self, config_manager, gui_mailbox, command_mailbox, visualizer_mailbox, recorder=None):
+        # gui_mailbox / visualizer_mailbox がNoneならGUI/Visualizer向けのデータを送らない (ヘッドレス)
         super().__init__()
         self.config = config_manager
-        self.gui_data_queue = gui_data_queue
-        self.gui_command_queue = gui_command_queue
-        self.visualizer_data_queue = visualizer_data_queue
+        self.gui_mailbox = gui_mailbox
+        self.command_mailbox = command_mailbox
+        self.visualizer_mailbox = visualizer_mailbox
         self.running = True
+        self.recorder = recorder # 指定されていればランドマークとJoy-Conの状態を記録する
 
         self.camera_tracker = None
         self.joycon_manager = None
         self.data_processor = None
         self.osc_sender = None
+        self.output_filter = None
+        self.subsystem_outputs = {} # 推論をスキップしたフレームで使い回すDataProcessorの出力
+
+        # プレビュー描画はGUIのプレビュータブが表示されている時だけ、設定したフレームレートで行う
+        self.preview_renderer = None # 初めてプレビューを描画する時に作る
+        self.preview_visible = False
+        self.preview_interval = 1.0 / self.config.get_preview_fps()
+        self.last_preview_time = 0.0
+
+        # キャプチャから送信までの区間ごとのレイテンシ。GUIには集計結果を一定間隔で送る
+        self.tracer = LatencyTracer()
+        self.latency_interval = 0.5
+        self.last_latency_time = 0.0
+
+        # Joy-Conの処理は出力スレッドが行い、GUI/Visualizer向けの結果だけここに置く
+        self.joycon_outputs = None
+        self.osc_output = None
         self._initialize_modules()
 
+        # OSCは出力スレッドが一定レートで送信する。トラッキングスレッドは状態を書き込むだけ
+        self.osc_output = OSCOutputThread(self.osc_sender, rate=self.config.get_osc_output_rate(), tracer=self.tracer,
+                                          output_filter=self.output_filter)
+        self.osc_output.add_source(self._poll_joycon)
+
     def _initialize_modules(self):
-        if self.camera_tracker:
-            self.camera_tracker.release()
-        self.camera_tracker = CameraTracker(
+        self.camera_tracker = self._create_camera_tracker()
+        self.joycon_manager = JoyConManager()
+        self.data_processor = DataProcessor(self.config)
+        self.osc_sender = OSCSender(self.config.get_osc_host(), self.config.get_osc_port())
+        self._configure_osc_sender()
+        self.output_filter = self._create_output_filter()
+        # 次にAPPLY_SETTINGSを受けた時に差分を取るための、適用済みの設定
+        self.applied_settings = self.config.as_dict()
+
+    def _create_camera_tracker(self):
+        tracker_kwargs = dict(
             device_id=self.config.get_camera_device_id(),
             pose_min_detection_confidence=self.config.get_pose_min_detection_confidence(),
-            pose_min_tracking_confidence=self.config.get_pose_min_tracking_confidence()
+            pose_min_tracking_confidence=self.config.get_pose_min_tracking_confidence(),
+            parallel_inference=self.config.get_parallel_inference(),
+            inference_rates=self._get_inference_rates(),
+            motion_detector=self._create_motion_detector(),
+            camera_probe=self._create_camera_probe(),
+            capture_format=self.config.get_camera_capture_format(),
+            inference_widths=self._get_inference_widths()
         )
+        extra_device_ids = self.config.get_camera_extra_device_ids()
+        if extra_device_ids:
+            # 複数のカメラはそれぞれの推論ワーカーで動かし、結果をまとめる (worker_processの設定によらない)
+            device_ids = [tracker_kwargs.pop("device_id")] + extra_device_ids
+            camera_probes = [tracker_kwargs.pop("camera_probe")] + [self._create_camera_probe(device_id) for device_id in extra_device_ids]
+            return MultiCameraTracker(device_ids, camera_probes, cpu_affinity=self.config.get_inference_worker_cpus(), **tracker_kwargs)
+        if self.config.get_inference_worker_enabled():
+            # キャプチャと推論は別プロセスで行い、結果を共有メモリで受け取る
+            return RemoteCameraTracker(cpu_affinity=self.config.get_inference_worker_cpus(), **tracker_kwargs)
+        return CameraTracker(**tracker_kwargs)
 
-        if self.joycon_manager:
-            self.joycon_manager.disconnect()
-        self.joycon_manager = JoyConManager()
+    def _get_inference_rates(self):
+        return {name: self.config.get_inference_rate(name) for name in ("hands", "face", "pose")}
 
-        self.data_processor = DataProcessor(self.config)
-        
-        if self.osc_sender:
-            self.osc_sender.client.remote_address = (self.config.get_osc_host(), self.config.get_osc_port())
-        else:
-            self.osc_sender = OSCSender(self.config.get_osc_host(), self.config.get_osc_port())
+    def _get_inference_widths(self):
+        return {name: self.config.get_inference_width(name) for name in ("hands", "face", "pose")}
+
+    def _create_motion_detector(self):
+        if not self.config.get_motion_gate_enabled():
+            return None
+        return MotionDetector(
+            threshold=self.config.get_motion_threshold(),
+            max_skip=self.config.get_motion_max_skip(),
+            idle_timeout=self.config.get_idle_timeout(),
+            idle_refresh_interval=self.config.get_idle_refresh_interval()
+        )
+
+    def _create_camera_probe(self, extra_device_id=None):
+        if extra_device_id is not None:
+            # 追加のカメラは指定したデバイスだけを試す (自動検出で他のカメラのデバイスを開かないようにする)
+            return CameraProbe(
+                cache_path=f"VRC_tracker/camera_cache_{extra_device_id}.json",
+                probe_range=0,
+                timeout=self.config.get_camera_probe_timeout()
+            )
+        return CameraProbe(
+            probe_range=self.config.get_camera_probe_range(),
+            timeout=self.config.get_camera_probe_timeout()
+        )
+
+    def _create_output_filter(self):
+        if not self.config.get_output_filter_enabled():
+            return None
+        return OutputFilterBank(**self.config.get_output_filter_parameters())
+
+    def _configure_osc_sender(self):
+        self.osc_sender.configure(
+            quantization_step=self.config.get_osc_quantization_step(),
+            deadband=self.config.get_osc_deadband(),
+            deadbands=self.config.get_osc_deadbands(),
+            keepalive_interval=self.config.get_osc_keepalive_interval()
+        )
+
+    def _apply_settings(self):
+        """前回適用した設定との差分だけを反映する。カメラやMediaPipeのグラフは必要な時だけ作り直す"""
+        settings = self.config.as_dict()
+        changed = {key for key in settings.keys() | self.applied_settings.keys() if settings.get(key) != self.applied_settings.get(key)}
+        self.applied_settings = settings
+        changed_sections = {section for section, _ in changed}
+        if changed:
+            print(f"Changed settings: {', '.join(f'{section}.{key}' for section, key in sorted(changed))}")
+
+        # 閾値や感度はスナップショットを差し替えるだけ (Joy-Conは再接続しない)
+        self.data_processor.update_settings(self.config.snapshot)
+        self.subsystem_outputs = {}
+
+        if 'OSC' in changed_sections:
+            self.osc_sender.set_target(self.config.get_osc_host(), self.config.get_osc_port())
+        if changed_sections & {'OSCOutput', 'OSCDeadband'}:
+            self._configure_osc_sender()
+            self.osc_output.set_rate(self.config.get_osc_output_rate())
+        if 'Preview' in changed_sections:
+            self.preview_interval = 1.0 / self.config.get_preview_fps()
+        if 'OutputFilter' in changed_sections:
+            # パラメータだけが変わった時はフィルタの状態を残す
+            if self.output_filter and self.config.get_output_filter_enabled():
+                self.output_filter.configure(**self.config.get_output_filter_parameters())
+            else:
+                self.output_filter = self._create_output_filter()
+                self.osc_output.output_filter = self.output_filter
+
+        # 推論ワーカーや使うカメラの設定が変わった時はトラッカーごと作り直す (作り直したトラッカーは今の設定で動く)
+        if changed & {('Inference', 'worker_process'), ('Inference', 'worker_cpus'), ('Camera', 'extra_device_ids')}:
+            self.camera_tracker.release()
+            self.camera_tracker = self._create_camera_tracker()
+            return
+
+        camera_tracker = self.camera_tracker
+        format_changed = bool(changed & {('Camera', key) for key in CAPTURE_FORMAT_KEYS})
+        if format_changed:
+            camera_tracker.set_capture_format(self.config.get_camera_capture_format())
+        # カメラはデバイスかキャプチャの形式が変わった時 (と、まだ開けていない時) だけ開き直す
+        if ('Camera', 'device_id') in changed or format_changed or camera_tracker.cap is None:
+            camera_tracker.open_camera(self.config.get_camera_device_id(), self._create_camera_probe())
+        if 'PoseTracking' in changed_sections:
+            camera_tracker.set_pose_confidence(
+                self.config.get_pose_min_detection_confidence(),
+                self.config.get_pose_min_tracking_confidence()
+            )
+        if 'Inference' in changed_sections:
+            camera_tracker.set_parallel_inference(self.config.get_parallel_inference())
+            camera_tracker.set_inference_rates(self._get_inference_rates())
+            camera_tracker.set_inference_widths(self._get_inference_widths())
+            camera_tracker.set_motion_detector(self._create_motion_detector())
+
+    def _process_subsystem(self, name, process_func, results):
+        # そのモデルが今回推論されていなければ、前回の処理結果をそのまま使う
+        if name in self.camera_tracker.updated_models or name not in self.subsystem_outputs:
+            self.subsystem_outputs[name] = process_func(results)
+            # フィルタには新しく推論した結果だけを、推論に使ったフレームのキャプチャ時刻で入れる
+            if self.output_filter:
+                self.output_filter.observe(self.subsystem_outputs[name][0], self.camera_tracker.frame_timestamp)
+        return self.subsystem_outputs[name]
+
+    def _poll_joycon(self):
+        # 出力スレッドから毎tick呼ばれるので、Joy-Conのデータはカメラのフレームループを待たずに送信される
+        joycon_manager = self.joycon_manager
+        data_processor = self.data_processor
+        # 前回のtickから届いたIMUサンプルをリングバッファから (コピーせずに) 受け取る
+        joycon_samples = joycon_manager.read_new_samples()
+        if self.recorder:
+            self.recorder.record_joycon(joycon_samples)
+        if not joycon_samples:
+            self.joycon_outputs = None
+            return {}
+
+        now = time.monotonic()
+        joycon_connected = [side.capitalize() for side in ("left", "right") if joycon_manager.is_receiving(side, now)]
+
+        joycon_osc_params, joycon_info, joycon_visualizer_data = data_processor.process_joycon_data(joycon_samples)
+        self.joycon_outputs = (joycon_connected, joycon_info, joycon_visualizer_data)
+        return joycon_osc_params
+
+    def _handle_command(self, command):
+        if command["type"] == "APPLY_SETTINGS":
+            # GUIが書き込んだ設定とスナップショットをそのまま使う (ファイルを読み直すと未保存の変更が失われる)
+            print("Applying settings from GUI...")
+            self._apply_settings()
+        elif command["type"] == "PREVIEW_VISIBILITY":
+            self.preview_visible = command["visible"]
+        elif command["type"] == "DUMP_LATENCY":
+            self.tracer.dump(command["path"])
+            print(f"Latency histograms written to {command['path']}")
+        elif command["type"] == "RESET_LATENCY":
+            self.tracer.reset()
+        elif command["type"] == "RECENTER_JOYCON":
+            # 姿勢は出力スレッドが更新しているので、次に届いたサンプルで反映される
+            self.data_processor.recenter_joycons()
+
+    def _tick(self):
+        """1フレーム分の処理。新しいフレームを処理した時はTrueを返す"""
+        for command in self.command_mailbox.take().values():
+            self._handle_command(command)
+
+        # pose_resultsも受け取るように変更
+        hand_results, face_results, pose_results, frame = self.camera_tracker.get_landmarks()
+        trace = self.camera_tracker.trace if frame is not None else None
+        if self.recorder and frame is not None:
+            self.recorder.record_frame(self.camera_tracker.frame_timestamp, hand_results, face_results, pose_results,
+                                       self.camera_tracker.updated_models)
+        if trace:
+            trace.processing_start = time.monotonic()
+
+        info_for_gui = {
+            "hands_detected": [],
+            "face_detected": False,
+            "pose_detected": False, # ポーズ検出状態を追加
+            "joycon_connected": []
+        }
+        visualizer_data = {}
+        osc_params = {} # このフレームで更新されたパラメータ (送信は出力スレッドが行う)
+
+        # ハンドトラッキングデータの処理と送信
+        if hand_results and hand_results.multi_hand_landmarks:
+            for hand_idx, hand_landmarks in enumerate(hand_results.multi_hand_landmarks):
+                handedness = hand_results.multi_handedness[hand_idx].classification[0].label
+                info_for_gui["hands_detected"].append(handedness)
+
+            hand_osc_params, hand_info, hand_visualizer_data = self._process_subsystem("hands", self.data_processor.process_hand_data, hand_results)
+            osc_params.update(hand_osc_params)
+            info_for_gui.update(hand_info)
+            visualizer_data.update(hand_visualizer_data)
+
+        # フェイストラッキングデータの処理と送信
+        if face_results and face_results.multi_face_landmarks:
+            info_for_gui["face_detected"] = True
+            face_osc_params, face_info, face_visualizer_data = self._process_subsystem("face", self.data_processor.process_face_data, face_results)
+            osc_params.update(face_osc_params)
+            info_for_gui.update(face_info)
+            visualizer_data.update(face_visualizer_data)
+
+        # ポーズトラッキングデータの処理と送信
+        if pose_results and pose_results.pose_landmarks:
+            info_for_gui["pose_detected"] = True
+            pose_osc_params, pose_info, pose_visualizer_data = self._process_subsystem("pose", self.data_processor.process_pose_data, pose_results)
+            osc_params.update(pose_osc_params)
+            info_for_gui.update(pose_info)
+            visualizer_data.update(pose_visualizer_data)
+
+        # Joy-Conの処理結果 (出力スレッドが更新している)
+        joycon_outputs = self.joycon_outputs
+        if joycon_outputs:
+            joycon_connected, joycon_info, joycon_visualizer_data = joycon_outputs
+            info_for_gui["joycon_connected"] = joycon_connected
+            info_for_gui.update(joycon_info)
+            visualizer_data.update(joycon_visualizer_data)
+
+        # 出力スレッドの状態を更新 (トレースは送信後に出力スレッドが集計する)
+        if trace:
+            trace.processed = time.monotonic()
+        if osc_params:
+            self.osc_output.update(osc_params, trace)
+        elif trace:
+            self.tracer.record_trace(trace)
+
+        # プレビューが見えている時だけ、縮小したフレームに検出結果を描画してGUIに送信
+        now = time.monotonic()
+        # GUIが前のプレビューをまだ受け取っていなければ、上書きされるだけなので描画しない
+        if (frame is not None and self.preview_visible and now - self.last_preview_time >= self.preview_interval
+                and self.gui_mailbox and not self.gui_mailbox.pending("frame")):
+            if self.preview_renderer is None:
+                from modules.preview_renderer import PreviewRenderer
+                self.preview_renderer = PreviewRenderer()
+            self.gui_mailbox.put("frame", self.preview_renderer.render(frame, hand_results, face_results, pose_results))
+            self.last_preview_time = now
+        if self.gui_mailbox and now - self.last_latency_time >= self.latency_interval:
+            self.gui_mailbox.put("latency", self.tracer.summary())
+            # GUI/Visualizerが読む前に上書きされたデータの数も一緒に表示する
+            self.gui_mailbox.put("mailboxes", {"gui": self.gui_mailbox.stats(), "visualizer": self.visualizer_mailbox.stats()})
+            self.last_latency_time = now
+
+        # GUIとVisualizerに最新のデータを送信 (まだ読まれていない古いデータは上書きする)
+        if self.gui_mailbox:
+            self.gui_mailbox.put("info", info_for_gui)
+        if self.visualizer_mailbox:
+            self.visualizer_mailbox.put("data", visualizer_data)
+
+        return frame is not None
 
     def run(self):
         print("Tracking thread started.")
-        while self.running:
-            try:
+        self.osc_output.start()
+        try:
+            while self.running:
                 try:
-                    command = self.gui_command_queue.get_nowait()
-                    if command["type"] == "APPLY_SETTINGS":
-                        print("Applying settings from GUI...")
-                        self.config.load_config()
-                        self._initialize_modules()
-                except queue.Empty:
-                    pass
-
-                # pose_resultsも受け取るように変更
-                hand_results, face_results, pose_results, frame = self.camera_tracker.get_landmarks()
-                joycon_status = self.joycon_manager.get_status()
-
-                info_for_gui = {
-                    "hands_detected": [],
-                    "face_detected": False,
-                    "pose_detected": False, # ポーズ検出状態を追加
-                    "joycon_connected": []
-                }
-                visualizer_data = {}
-
-                # ハンドトラッキングデータの処理と送信
-                if hand_results and hand_results.multi_hand_landmarks:
-                    for hand_idx, hand_landmarks in enumerate(hand_results.multi_hand_landmarks):
-                        handedness = hand_results.multi_handedness[hand_idx].classification[0].label
-                        info_for_gui["hands_detected"].append(handedness)
-                    
-                    hand_osc_params, hand_info, hand_visualizer_data = self.data_processor.process_hand_data(hand_results)
-                    for address, value in hand_osc_params.items():
-                        self.osc_sender.send(address, value)
-                    info_for_gui.update(hand_info)
-                    visualizer_data.update(hand_visualizer_data)
-
-                # フェイストラッキングデータの処理と送信
-                if face_results and face_results.multi_face_landmarks:
-                    info_for_gui["face_detected"] = True
-                    face_osc_params, face_info, face_visualizer_data = self.data_processor.process_face_data(face_results)
-                    for address, value in face_osc_params.items():
-                        self.osc_sender.send(address, value)
-                    info_for_gui.update(face_info)
-                    visualizer_data.update(face_visualizer_data)
-
-                # ポーズトラッキングデータの処理と送信
-                if pose_results and pose_results.pose_landmarks:
-                    info_for_gui["pose_detected"] = True
-                    pose_osc_params, pose_info, pose_visualizer_data = self.data_processor.process_pose_data(pose_results)
-                    for address, value in pose_osc_params.items():
-                        self.osc_sender.send(address, value)
-                    info_for_gui.update(pose_info)
-                    visualizer_data.update(pose_visualizer_data)
-
-                # Joy-Conデータの処理と送信
-                if joycon_status:
-                    if 'left' in joycon_status:
-                        info_for_gui["joycon_connected"].append("Left")
-                    if 'right' in joycon_status:
-                        info_for_gui["joycon_connected"].append("Right")
-
-                    joycon_osc_params, joycon_info, joycon_visualizer_data = self.data_processor.process_joycon_data(joycon_status)
-                    for address, value in joycon_osc_params.items():
-                        self.osc_sender.send(address, value)
-                    info_for_gui.update(joycon_info)
-                    visualizer_data.update(joycon_visualizer_data)
-
-                # カメラフレームをGUIに送信
-                if frame is not None:
-                    info_for_gui["frame"] = frame
-
-                # GUIにデータを送信
-                if not self.gui_data_queue.full():
-                    self.gui_data_queue.put({"type": "TRACKING_DATA", "info": info_for_gui})
-
-                # Visualizerにデータを送信
-                if not self.visualizer_data_queue.full():
-                    self.visualizer_data_queue.put({"type": "VISUALIZER_DATA", "data": visualizer_data})
-
-                time.sleep(0.01)
-
-            except Exception as e:
-                print(f"Tracking thread error: {e}")
-                time.sleep(1)
+                    # get_landmarksは新しいフレームが来るまで待つので、カメラが無い時だけ待機する
+                    if not self._tick():
+                        time.sleep(0.01)
+                except Exception as e:
+                    print(f"Tracking thread error: {e}")
+                    time.sleep(1)
+        finally:
+            self._shutdown()
 
     def stop(self):
+        # 後片付けはrunの最後にこのスレッドで行う (推論中のMediaPipeの計算グラフを別スレッドから閉じないようにする)
         self.running = False
+
+    def _shutdown(self):
+        if self.osc_output:
+            self.osc_output.stop()
+            # Joy-Conとレコーダーを閉じる前に、送信中のpublishが終わるのを待つ (終了後にバンドルを送らないようにする)
+            self.osc_output.join(1.0) # デーモンスレッドなので長くは待たない
         if self.camera_tracker:
             self.camera_tracker.release()
         if self.joycon_manager:
             self.joycon_manager.disconnect()
+        if self.recorder:
+            self.recorder.close()
         print("Tracking thread stopped.")
 
 class Application:
-    def __init__(self):
+    def __init__(self, record_path=None):
         self.config = ConfigManager('VRC_tracker/settings.ini')
-        self.gui_data_queue = queue.Queue(maxsize=1)
-        self.gui_command_queue = queue.Queue(maxsize=1)
-        self.visualizer_data_queue = queue.Queue(maxsize=1)
+        self.gui_mailbox = Mailbox()
+        # コマンドは種類ごとに最新のものだけを処理する (同じ種類のコマンドが続けて来ても1回にまとめる)
+        self.command_mailbox = Mailbox()
+        self.visualizer_mailbox = Mailbox()
 
-        self.tracking_thread = TrackingThread(self.config, self.gui_data_queue, self.gui_command_queue, self.visualizer_data_queue)
-        self.gui = GUI(self.config, self.gui_data_queue, self.gui_command_queue)
-        self.visualizer_thread = VisualizerThread(self.visualizer_data_queue)
+        recorder = SessionRecorder(record_path) if record_path else None
+        self.tracking_thread = TrackingThread(self.config, self.gui_mailbox, self.command_mailbox, self.visualizer_mailbox, recorder)
+
+        from gui import GUI
+        from visualizer import VisualizerThread
+        self.gui = GUI(self.config, self.gui_mailbox, self.command_mailbox)
+        self.visualizer_thread = VisualizerThread(self.visualizer_mailbox)
 
     def run(self):
         self.tracking_thread.start()
@@ -165,6 +380,36 @@ class Application:
         self.visualizer_thread.join()
         self.gui.destroy()
 
+class HeadlessApplication:
+    """GUIとVisualizerを使わずに、トラッキングとOSC出力だけを動かす (Ctrl+Cで終了)"""
+
+    def __init__(self, record_path=None):
+        self.config = ConfigManager('VRC_tracker/settings.ini')
+        recorder = SessionRecorder(record_path) if record_path else None
+        self.tracking_thread = TrackingThread(self.config, None, Mailbox(), None, recorder)
+
+    def run(self):
+        self.tracking_thread.start()
+        try:
+            while self.tracking_thread.is_alive():
+                self.tracking_thread.join(0.5)
+        except KeyboardInterrupt:
+            print("Closing application...")
+        self.tracking_thread.stop()
+        self.tracking_thread.join()
+
+        end_to_end = self.tracking_thread.tracer.summary().get("end_to_end")
+        if end_to_end:
+            print(f"End-to-end latency: p50 {end_to_end['p50']:.1f}ms, p95 {end_to_end['p95']:.1f}ms, p99 {end_to_end['p99']:.1f}ms")
+
 if __name__ == "__main__":
-    app = Application()
+    parser = argparse.ArgumentParser(description="VRC_traker")
+    parser.add_argument("--record", metavar="DIR", help="Record landmarks and Joy-Con status to DIR (replay with replay.py)")
+    parser.add_argument("--headless", action="store_true", help="Run tracking and OSC output only, without the GUI and visualizer")
+    args = parser.parse_args()
+
+    if args.headless:
+        app = HeadlessApplication(record_path=args.record)
+    else:
+        app = Application(record_path=args.record)
     app.run()
\ No newline at end of file
@@ -0,0 +1,165 @@
+import json
+import os
+import queue
+import threading
+import time
+import cv2
+
+DEFAULT_CACHE_PATH = 'VRC_tracker/camera_cache.json'
+
+def decode_fourcc(value):
+    code = int(value)
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip("\0")
+
+def probe_device(device_id):
+    """カメラを開いて1フレーム読めるか確認する。成功すれば開いたままのキャプチャと性能情報を返す"""
+    cap = cv2.VideoCapture(device_id)
+    if not cap.isOpened():
+        cap.release()
+        return None, None
+    ok, frame = cap.read()
+    if not ok or frame is None:
+        cap.release()
+        return None, None
+
+    capabilities = {
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+        "fourcc": decode_fourcc(cap.get(cv2.CAP_PROP_FOURCC)),
+        "backend": cap.getBackendName(),
+        "probed_at": time.time(),
+    }
+    return cap, capabilities
+
+class _ProbeSession:
+    """複数のデバイスを並列に試す。決まった後に遅れて開けたキャプチャは各スレッド側で解放する"""
+
+    def __init__(self, device_ids):
+        self.results = queue.Queue()
+        self.lock = threading.Lock()
+        self.closed = False
+        self.pending = set(device_ids)
+        for device_id in device_ids:
+            # cv2.VideoCaptureは途中で止められないので、タイムアウトしたスレッドは放置できるようにdaemonにする
+            threading.Thread(target=self._probe, args=(device_id,), daemon=True, name=f"camera-probe-{device_id}").start()
+
+    def _probe(self, device_id):
+        try:
+            cap, capabilities = probe_device(device_id)
+        except Exception as e:
+            print(f"Error probing video device {device_id}: {e}")
+            cap, capabilities = None, None
+        with self.lock:
+            if self.closed:
+                if cap is not None:
+                    cap.release()
+                return
+            self.results.put((device_id, cap, capabilities))
+
+    def collect(self, priority, timeout):
+        """priorityの順に最も優先度の高い成功したデバイスが確定するまで待つ"""
+        opened = {}
+        deadline = time.monotonic() + timeout
+        while self.pending:
+            # 自分より優先度の高いデバイスがすべて失敗していれば、残りを待たずに決める
+            for device_id in priority:
+                if device_id in opened:
+                    return self._finish(device_id, opened)
+                if device_id in self.pending:
+                    break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                print(f"Camera probe timed out for devices: {sorted(self.pending)}")
+                break
+            try:
+                device_id, cap, capabilities = self.results.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            self.pending.discard(device_id)
+            if cap is not None:
+                opened[device_id] = (cap, capabilities)
+
+        for device_id in priority:
+            if device_id in opened:
+                return self._finish(device_id, opened)
+        return self._finish(None, opened)
+
+    def _finish(self, chosen_id, opened):
+        with self.lock:
+            self.closed = True
+            # closedにする前にキューへ入った分も回収する
+            while True:
+                try:
+                    device_id, cap, capabilities = self.results.get_nowait()
+                except queue.Empty:
+                    break
+                if cap is not None:
+                    opened[device_id] = (cap, capabilities)
+        for device_id, (cap, _) in opened.items():
+            if device_id != chosen_id:
+                cap.release()
+        if chosen_id is None:
+            return None, None, None
+        cap, capabilities = opened[chosen_id]
+        return chosen_id, cap, capabilities
+
+class CameraProbe:
+    """カメラデバイスを探して開く。最後に使えたデバイスと性能情報をキャッシュし、次回以降はそれを最初に試す"""
+
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, probe_range=5, timeout=3.0):
+        self.cache_path = cache_path
+        self.probe_range = probe_range # 自動検出で試すID (0からprobe_range-1まで)
+        self.timeout = timeout
+        self.cache = self._load_cache()
+
+    def _load_cache(self):
+        try:
+            with open(self.cache_path) as cache_file:
+                cache = json.load(cache_file)
+            return {"last_good": cache.get("last_good"), "devices": cache.get("devices", {})}
+        except (OSError, ValueError):
+            return {"last_good": None, "devices": {}}
+
+    def _save_cache(self):
+        try:
+            with open(self.cache_path, "w") as cache_file:
+                json.dump(self.cache, cache_file, indent=2)
+        except OSError as e:
+            print(f"Could not write camera cache: {e}")
+
+    def get_capabilities(self, device_id):
+        return self.cache["devices"].get(str(device_id))
+
+    def open(self, device_id):
+        """(デバイスID, キャプチャ, 性能情報) を返す。見つからなければすべてNone"""
+        # 1. 設定されたデバイスと前回使えたデバイスだけを並列に試す
+        first_candidates = [device_id]
+        last_good = self.cache["last_good"]
+        if last_good is not None and last_good != device_id:
+            first_candidates.append(last_good)
+        opened_id, cap, capabilities = _ProbeSession(first_candidates).collect(first_candidates, self.timeout)
+
+        # 2. どちらも開けなければ残りのIDをまとめて並列に試す
+        if cap is None:
+            rest = [i for i in range(self.probe_range) if i not in first_candidates]
+            if rest:
+                print(f"Warning: Could not open video device {device_id}. Probing devices 0-{self.probe_range - 1}...")
+                opened_id, cap, capabilities = _ProbeSession(rest).collect(rest, self.timeout)
+            else:
+                # probe_range=0 (追加のカメラ) では他のIDを探さない
+                print(f"Warning: Could not open video device {device_id}. Auto-detection is disabled for this camera.")
+
+        if cap is None:
+            if last_good is not None:
+                self.cache["last_good"] = None
+                self._save_cache()
+            return None, None, None
+
+        if opened_id != device_id:
+            print(f"Using video device {opened_id} instead of {device_id}.")
+        self.cache["last_good"] = opened_id
+        self.cache["devices"][str(opened_id)] = capabilities
+        self._save_cache()
+        return opened_id, cap, capabilities
@@ -1,93 +1,244 @@
+import time
 import cv2
 import mediapipe as mp
+from concurrent.futures import ThreadPoolExecutor
+
+from modules.camera_probe import CameraProbe, decode_fourcc
+from modules.frame_grabber import FrameGrabber
+from modules.inference_scheduler import InferenceScheduler
+from modules.latency_tracer import FrameTrace
+
+def inference_size(frame_shape, width):
+    """推論に使う (幅, 高さ)。widthが0かフレーム以上ならキャプチャした解像度のまま"""
+    frame_height, frame_width = frame_shape[:2]
+    if not width or width >= frame_width:
+        return frame_width, frame_height
+    return width, max(1, round(frame_height * width / frame_width))
+
+def prepare_inference_images(frame, sizes):
+    """モデル名 -> (幅, 高さ) に従って、縮小してからRGBに変換した画像を返す。同じ解像度のモデルは同じ画像を使う"""
+    images = {}
+    model_images = {}
+    for name, size in sizes.items():
+        image = images.get(size)
+        if image is None:
+            # 色変換は縮小した画像に対して行う (キャプチャした解像度のまま変換しない)
+            if size != (frame.shape[1], frame.shape[0]):
+                image = cv2.cvtColor(cv2.resize(frame, size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+            else:
+                image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            images[size] = image
+        model_images[name] = image
+    return model_images
 
 class CameraTracker:
-    def __init__(self, device_id=0, pose_min_detection_confidence=0.5, pose_min_tracking_confidence=0.5):
+    def __init__(self, device_id=0, pose_min_detection_confidence=0.5, pose_min_tracking_confidence=0.5, parallel_inference=True, inference_rates=None, motion_detector=None, camera_probe=None,
+                 capture_format=None, inference_widths=None):
         self.cap = None
+        self.grabber = None
+        self.executor = None
+        self.frame_seq = 0
+        self.frame_timestamp = 0.0 # 推論に使ったフレームのキャプチャ時刻 (time.monotonic)
+        self.trace = None # 直近のフレームのFrameTrace (キャプチャと各モデルの推論時刻)
+        # 各モデルの最新の推論結果。推論をスキップしたフレームではこれを使い回す
+        self.results = {"hands": None, "face": None, "pose": None}
+        self.updated_models = set() # 直近のget_landmarksで推論し直したモデル
+        self.last_inference_time = {name: None for name in self.results}
+        self.regions = {name: None for name in self.results} # 前回検出したランドマークの範囲 (正規化座標)
+        self.motion_detector = motion_detector # Noneなら動きによる推論の省略を行わない
         self.pose_min_detection_confidence = pose_min_detection_confidence
         self.pose_min_tracking_confidence = pose_min_tracking_confidence
+        # キャプチャの形式 (fourcc, width, height, fps, buffer_size)。指定が無い項目はカメラの既定のまま
+        self.capture_format = capture_format or {}
+        # モデルごとの推論に使う画像の幅 (0ならキャプチャした解像度のまま)
+        self.inference_widths = inference_widths or {}
+        self.camera_probe = None
 
-        self.cap = cv2.VideoCapture(device_id)
-        if not self.cap.isOpened():
-            print(f"Warning: Could not open video device {device_id}. Attempting auto-detection...")
-            found_camera = False
-            for i in range(5): # ID 0から4までを試す (必要に応じて範囲を広げてください)
-                print(f"Attempting to open camera with ID: {i}")
-                self.cap = cv2.VideoCapture(i)
-                if self.cap.isOpened():
-                    print(f"Successfully opened video device {i}.")
-                    found_camera = True
-                    break
-                else:
-                    self.cap.release() # 開けなかった場合は解放
-            if not found_camera:
-                print("Error: No working camera found. Please check camera connections.")
-                self.cap = None # カメラが見つからなかった場合はNoneを設定
-                return
-        else:
-            print(f"Successfully opened video device {device_id}.")
-
-        self.mp_hands = mp.solutions.hands
-        self.hands = self.mp_hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.7
+        self.models = {} # カメラを開けた時に作る
+        self.scheduler = InferenceScheduler(inference_rates or {name: 0 for name in self.results})
+        self.set_parallel_inference(parallel_inference)
+        self.open_camera(device_id, camera_probe)
+
+    def open_camera(self, device_id, camera_probe=None):
+        """カメラを (開き直して) キャプチャスレッドを起動する。MediaPipeのモデルはそのまま使い続ける"""
+        self._release_camera()
+
+        # 設定されたデバイスと前回使えたデバイスを並列に試し、だめなら残りのIDを並列に探す
+        self.camera_probe = camera_probe = camera_probe or CameraProbe()
+        self.device_id, self.cap, self.capabilities = camera_probe.open(device_id)
+        if self.cap is None:
+            print("Error: No working camera found. Please check camera connections.")
+            return False
+        self._apply_capture_format()
+        print(f"Successfully opened video device {self.device_id} "
+              f"({self.capabilities['width']}x{self.capabilities['height']} @ {self.capabilities['fps']:.0f}fps "
+              f"{self.capabilities['fourcc'] or '?'}, {self.capabilities['backend']}).")
+
+        # キャプチャは専用スレッドで行い、推論側は常に最新フレームだけを取る
+        self.frame_seq = 0 # 新しいFrameGrabberのシーケンス番号は1から始まる
+        self.grabber = FrameGrabber(self.cap)
+        self.grabber.start()
+
+        if not self.models:
+            for name in self.results:
+                self.models[name] = self._create_model(name)
+        return True
+
+    def _apply_capture_format(self):
+        """設定した形式をカメラに要求し、実際に使われる形式で性能情報を更新する (対応していない値はカメラが近い値にするか無視する)"""
+        capture_format = self.capture_format
+        # FOURCCは解像度より先に設定する (形式によって選べる解像度とフレームレートが変わる)
+        if capture_format.get("fourcc"):
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*capture_format["fourcc"]))
+        if capture_format.get("width") and capture_format.get("height"):
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, capture_format["width"])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, capture_format["height"])
+        if capture_format.get("fps"):
+            self.cap.set(cv2.CAP_PROP_FPS, capture_format["fps"])
+        # OpenCV内部のバッファに古いフレームが溜まらないようにする (対応していないバックエンドでは無視される)
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, capture_format.get("buffer_size", 1))
+
+        self.capabilities = dict(self.capabilities,
+            width=int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            fps=self.cap.get(cv2.CAP_PROP_FPS),
+            fourcc=decode_fourcc(self.cap.get(cv2.CAP_PROP_FOURCC)),
         )
+
+    def set_capture_format(self, capture_format):
+        """新しい形式は次にカメラを開いた時に使われる"""
+        self.capture_format = capture_format
+
+    def reopen_camera(self):
+        return self.open_camera(self.device_id, self.camera_probe)
+
+    def set_inference_widths(self, inference_widths):
+        self.inference_widths = inference_widths
+
+    def _create_model(self, name):
+        if name == "hands":
+            return mp.solutions.hands.Hands(min_detection_confidence=0.7, min_tracking_confidence=0.7)
+        if name == "face":
+            return mp.solutions.face_mesh.FaceMesh(
+                max_num_faces=1,
+                refine_landmarks=True,
+                min_detection_confidence=0.7,
+                min_tracking_confidence=0.7
+            )
         # MediaPipe Poseの初期化
-        self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
+        return mp.solutions.pose.Pose(
             min_detection_confidence=self.pose_min_detection_confidence,
             min_tracking_confidence=self.pose_min_tracking_confidence
         )
-        self.mp_drawing = mp.solutions.drawing_utils
+
+    def set_pose_confidence(self, min_detection_confidence, min_tracking_confidence):
+        """Poseの計算グラフだけを作り直す (手と顔のモデルには触れない)"""
+        self.pose_min_detection_confidence = min_detection_confidence
+        self.pose_min_tracking_confidence = min_tracking_confidence
+        if "pose" in self.models:
+            self.models["pose"].close()
+            self.models["pose"] = self._create_model("pose")
+            self.results["pose"] = None
+            self.regions["pose"] = None
+
+    def set_parallel_inference(self, enabled):
+        # MediaPipeの計算グラフはGILを解放するので、3つのモデルをスレッドで同時に走らせる
+        if enabled and not self.executor:
+            self.executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="inference")
+        elif not enabled and self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def set_inference_rates(self, rates):
+        self.scheduler.set_rates(rates)
+
+    def set_motion_detector(self, motion_detector):
+        self.motion_detector = motion_detector
 
     def get_landmarks(self):
         if self.cap is None:
             return None, None, None, None # hand_results, face_results, pose_results, frame
 
-        success, frame = self.cap.read()
-        if not success:
-            print("Warning: Failed to read frame from camera.")
+        frame, timestamp, seq = self.grabber.get_latest(self.frame_seq)
+        if frame is None:
             return None, None, None, None
+        self.frame_seq = seq
+        self.frame_timestamp = timestamp
+        trace = FrameTrace(seq, timestamp)
+        self.trace = trace
+
+        # 目標レートに達していないモデルは推論せず、前回の結果を使い回す
+        due_models = self.scheduler.due_models(timestamp)
+
+        # 前回検出した範囲に動きが無ければ推論を省略する (スケジュール上は実行済みとして扱う)
+        if self.motion_detector:
+            self.motion_detector.update(frame, timestamp)
+            for name in list(due_models):
+                if self.motion_detector.allows_skip(name, self.regions[name], self.last_inference_time[name], timestamp):
+                    self.scheduler.mark_run(name, timestamp)
+                    due_models.remove(name)
+
+        if due_models:
+            trace.inference_start = time.monotonic()
+            # ランドマークは正規化座標なので、モデルごとに縮小した画像で推論しても結果の座標はそのまま使える
+            images = prepare_inference_images(frame, {name: inference_size(frame.shape, self.inference_widths.get(name, 0)) for name in due_models})
+
+            if self.executor and len(due_models) > 1:
+                futures = {name: self.executor.submit(self._process_model, name, images[name]) for name in due_models}
+                for name, future in futures.items():
+                    self.results[name], trace.inference[name] = future.result()
+            else:
+                for name in due_models:
+                    self.results[name], trace.inference[name] = self._process_model(name, images[name])
+
+            for name in due_models:
+                self.scheduler.mark_run(name, timestamp)
+                self.last_inference_time[name] = timestamp
+                if self.motion_detector:
+                    self.regions[name] = self._landmark_region(name)
+                    self.motion_detector.mark_inferred(name)
+        self.updated_models = set(due_models)
 
-        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        hand_results = self.hands.process(image_rgb)
-        face_results = self.face_mesh.process(image_rgb)
-        pose_results = self.pose.process(image_rgb) # ポーズの検出
-
-        # 検出結果をフレームに描画 (GUIプレビュー用)
-        if hand_results.multi_hand_landmarks:
-            for hand_landmarks in hand_results.multi_hand_landmarks:
-                self.mp_drawing.draw_landmarks(
-                    frame, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
-        if face_results.multi_face_landmarks:
-            for face_landmarks in face_results.multi_face_landmarks:
-                self.mp_drawing.draw_landmarks(
-                    image=frame,
-                    landmark_list=face_landmarks,
-                    connections=self.mp_face_mesh.FACEMESH_TESSELATION,
-                    landmark_drawing_spec=self.mp_drawing.DrawingSpec(color=(0,255,0), thickness=1, circle_radius=1),
-                    connection_drawing_spec=self.mp_drawing.DrawingSpec(color=(0,255,0), thickness=1, circle_radius=1)
-                )
-                self.mp_drawing.draw_landmarks(
-                    image=frame,
-                    landmark_list=face_landmarks,
-                    connections=self.mp_face_mesh.FACEMESH_CONTOURS,
-                    landmark_drawing_spec=self.mp_drawing.DrawingSpec(color=(255,0,0), thickness=2, circle_radius=2),
-                    connection_drawing_spec=self.mp_drawing.DrawingSpec(color=(255,0,0), thickness=2, circle_radius=2)
-                )
-        # ポーズのランドマークを描画
-        if pose_results.pose_landmarks:
-            self.mp_drawing.draw_landmarks(
-                frame, pose_results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+        hand_results = self.results["hands"]
+        face_results = self.results["face"]
+        pose_results = self.results["pose"] # ポーズの検出
 
         return hand_results, face_results, pose_results, frame
 
-    def release(self):
+    def _process_model(self, name, image_rgb):
+        start = time.monotonic()
+        results = self.models[name].process(image_rgb)
+        return results, (start, time.monotonic())
+
+    def _landmark_region(self, name):
+        results = self.results[name]
+        if name == "hands":
+            landmark_lists = results.multi_hand_landmarks or []
+        elif name == "face":
+            landmark_lists = results.multi_face_landmarks or []
+        else:
+            landmark_lists = [results.pose_landmarks] if results.pose_landmarks else []
+
+        xs = [lm.x for landmarks in landmark_lists for lm in landmarks.landmark]
+        if not xs:
+            return None # 未検出なら画面全体の動きで判定する
+        ys = [lm.y for landmarks in landmark_lists for lm in landmarks.landmark]
+        return min(xs), min(ys), max(xs), max(ys)
+
+    def _release_camera(self):
+        if self.grabber:
+            self.grabber.stop()
+            self.grabber = None
         if self.cap:
             self.cap.release()
-            print("Camera released.")
\ No newline at end of file
+            self.cap = None
+            print("Camera released.")
+
+    def release(self):
+        self._release_camera()
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        for model in self.models.values():
+            model.close()
+        self.models = {}
@@ -1,312 +1,265 @@
-import math
-import mediapipe as mp
-from config import ConfigManager
-import time
+import numpy as np
+from config import ConfigManager, TrackingSettings
+from modules.landmark_indices import HandLandmark, PoseLandmark, FaceLandmark
+from modules.joycon_ring import JOYCON_BUTTONS
+from modules.imu_fusion import ImuFusion
 
 class DataProcessor:
     def __init__(self, config_manager: ConfigManager):
         self.config = config_manager
-
-        self.mp_hands = mp.solutions.hands
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.mp_pose = mp.solutions.pose # MediaPipe Poseを初期化
-
-        self.THUMB_TIP = self.mp_hands.HandLandmark.THUMB_TIP
-        self.THUMB_MCP = self.mp_hands.HandLandmark.THUMB_MCP
-        self.INDEX_FINGER_TIP = self.mp_hands.HandLandmark.INDEX_FINGER_TIP
-        self.INDEX_FINGER_MCP = self.mp_hands.HandLandmark.INDEX_FINGER_MCP
-        self.MIDDLE_FINGER_TIP = self.mp_hands.HandLandmark.MIDDLE_FINGER_TIP
-        self.MIDDLE_FINGER_MCP = self.mp_hands.HandLandmark.MIDDLE_FINGER_MCP
-        self.RING_FINGER_TIP = self.mp_hands.HandLandmark.RING_FINGER_TIP
-        self.RING_FINGER_MCP = self.mp_hands.HandLandmark.RING_FINGER_MCP
-        self.PINKY_TIP = self.mp_hands.HandLandmark.PINKY_TIP
-        self.PINKY_MCP = self.mp_hands.HandLandmark.PINKY_MCP
-        self.WRIST = self.mp_hands.HandLandmark.WRIST
-
-        self.LEFT_EYE_UPPER = 159
-        self.LEFT_EYE_LOWER = 145
-        self.RIGHT_EYE_UPPER = 386
-        self.RIGHT_EYE_LOWER = 374
-
-        self.MOUTH_UPPER = 13
-        self.MOUTH_LOWER = 14
-
-        self.joycon_orientation_l = [0.0, 0.0, 0.0]
-        self.joycon_orientation_r = [0.0, 0.0, 0.0]
-        self.last_joycon_update_time = time.time()
-
-    def _get_distance(self, p1, p2):
-        return math.sqrt((p1.x - p2.x)**2 + (p1.y - p2.y)**2 + (p1.z - p2.z)**2)
-
-    def _calculate_angle(self, p1, p2, p3):
-        """3点から角度を計算 (p2が頂点)"""
+        # 設定はスナップショットごと差し替える (各処理の先頭で一度だけ参照する)
+        self.settings = config_manager.snapshot
+
+        self.THUMB_TIP = HandLandmark.THUMB_TIP
+        self.THUMB_MCP = HandLandmark.THUMB_MCP
+        self.INDEX_FINGER_TIP = HandLandmark.INDEX_FINGER_TIP
+        self.INDEX_FINGER_MCP = HandLandmark.INDEX_FINGER_MCP
+        self.MIDDLE_FINGER_TIP = HandLandmark.MIDDLE_FINGER_TIP
+        self.MIDDLE_FINGER_MCP = HandLandmark.MIDDLE_FINGER_MCP
+        self.RING_FINGER_TIP = HandLandmark.RING_FINGER_TIP
+        self.RING_FINGER_MCP = HandLandmark.RING_FINGER_MCP
+        self.PINKY_TIP = HandLandmark.PINKY_TIP
+        self.PINKY_MCP = HandLandmark.PINKY_MCP
+        self.WRIST = HandLandmark.WRIST
+
+        # 5本の指をまとめて計算するためのインデックス配列 (親指, 人差し指, 中指, 薬指, 小指)
+        self.FINGER_LABELS = ("Thumb", "Index", "Middle", "Ring", "Pinky")
+        self.FINGER_TIPS = np.array([self.THUMB_TIP, self.INDEX_FINGER_TIP, self.MIDDLE_FINGER_TIP, self.RING_FINGER_TIP, self.PINKY_TIP])
+        self.FINGER_MCPS = np.array([self.THUMB_MCP, self.INDEX_FINGER_MCP, self.MIDDLE_FINGER_MCP, self.RING_FINGER_MCP, self.PINKY_MCP])
+
+        self.LEFT_EYE_UPPER = FaceLandmark.LEFT_EYE_UPPER
+        self.LEFT_EYE_LOWER = FaceLandmark.LEFT_EYE_LOWER
+        self.RIGHT_EYE_UPPER = FaceLandmark.RIGHT_EYE_UPPER
+        self.RIGHT_EYE_LOWER = FaceLandmark.RIGHT_EYE_LOWER
+
+        self.MOUTH_UPPER = FaceLandmark.MOUTH_UPPER
+        self.MOUTH_LOWER = FaceLandmark.MOUTH_LOWER
+
+        # 左目, 右目, 口の上下のランドマーク
+        self.FACE_UPPER = np.array([self.LEFT_EYE_UPPER, self.RIGHT_EYE_UPPER, self.MOUTH_UPPER])
+        self.FACE_LOWER = np.array([self.LEFT_EYE_LOWER, self.RIGHT_EYE_LOWER, self.MOUTH_LOWER])
+        self.FACE_LANDMARKS = np.concatenate([self.FACE_UPPER, self.FACE_LOWER])
+
+        # 左右の順に並べたポーズのランドマーク
+        self.SHOULDERS = np.array([PoseLandmark.LEFT_SHOULDER, PoseLandmark.RIGHT_SHOULDER])
+        self.ELBOWS = np.array([PoseLandmark.LEFT_ELBOW, PoseLandmark.RIGHT_ELBOW])
+        self.WRISTS = np.array([PoseLandmark.LEFT_WRIST, PoseLandmark.RIGHT_WRIST])
+
+        # Joy-Conごとの姿勢 (IMUサンプルを四元数で積分する) と最後に処理したサンプル
+        self.joycon_fusions = {"left": ImuFusion(), "right": ImuFusion()}
+        self.latest_joycon_samples = {}
+
+    def _landmarks_to_array(self, landmark_list, with_visibility=False, indices=None):
+        """MediaPipeのランドマークを (N, 3) / (N, 4) のfloat32配列に一度だけ変換する。indicesを指定するとその点だけを変換する"""
+        points = getattr(landmark_list, "points", None)
+        if points is not None:
+            # 推論ワーカーから受け取ったランドマークは最初から配列になっている
+            points = points if with_visibility else points[:, :3]
+            return points if indices is None else points[indices]
+        landmarks = landmark_list.landmark
+        if indices is not None:
+            landmarks = [landmarks[i] for i in indices]
+        if with_visibility:
+            return np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in landmarks], dtype=np.float32)
+        return np.array([(lm.x, lm.y, lm.z) for lm in landmarks], dtype=np.float32)
+
+    def _calculate_angles(self, p1, p2, p3):
+        """3点から角度を計算 (p2が頂点)。(M, 3)の配列でM個分をまとめて計算し、度数で返す"""
         # ベクトルを計算
-        vec1 = [p1.x - p2.x, p1.y - p2.y, p1.z - p2.z]
-        vec2 = [p3.x - p2.x, p3.y - p2.y, p3.z - p2.z]
+        vec1 = p1 - p2
+        vec2 = p3 - p2
 
         # ドット積とベクトルの大きさ
-        dot_product = vec1[0]*vec2[0] + vec1[1]*vec2[1] + vec1[2]*vec2[2]
-        magnitude1 = math.sqrt(vec1[0]**2 + vec1[1]**2 + vec1[2]**2)
-        magnitude2 = math.sqrt(vec2[0]**2 + vec2[1]**2 + vec2[2]**2)
-
-        # コサインを計算し、アークコサインで角度を求める
-        if magnitude1 == 0 or magnitude2 == 0:
-            return 0.0 # ゼロ除算を避ける
-        
-        cosine_angle = dot_product / (magnitude1 * magnitude2)
-        # 浮動小数点誤差で範囲外になる可能性があるのでクランプ
-        cosine_angle = max(-1.0, min(1.0, cosine_angle))
-        angle_radians = math.acos(cosine_angle)
-        return math.degrees(angle_radians) # 度数で返す
+        dot_product = np.einsum('ij,ij->i', vec1, vec2)
+        magnitude = np.linalg.norm(vec1, axis=1) * np.linalg.norm(vec2, axis=1)
 
-    def _calculate_finger_curl(self, landmarks, tip_idx, mcp_idx, finger_name):
-        tip = landmarks.landmark[tip_idx]
-        mcp = landmarks.landmark[mcp_idx]
+        # コサインを計算し、アークコサインで角度を求める (大きさが0の場合は0度とする)
+        cosine_angle = np.divide(dot_product, magnitude, out=np.ones_like(dot_product), where=magnitude > 0)
+        # 浮動小数点誤差で範囲外になる可能性があるのでクランプ
+        cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
+        return np.degrees(np.arccos(cosine_angle))
 
-        open_y_diff, closed_y_diff = self.config.get_hand_curl_thresholds(finger_name)
+    def update_settings(self, settings: TrackingSettings):
+        self.settings = settings
 
-        current_y_diff = abs(tip.y - mcp.y)
+    def recenter_joycons(self):
+        for fusion in self.joycon_fusions.values():
+            fusion.recenter()
 
-        curl = 1.0 - ((current_y_diff - closed_y_diff) / (open_y_diff - closed_y_diff))
-        curl = max(0.0, min(1.0, curl))
+    def process_hand_data(self, hand_results):
+        if not hand_results.multi_hand_landmarks:
+            return {}, {}, {}
 
-        return curl
+        handedness = [h.classification[0].label for h in hand_results.multi_handedness]
+        hand_points = np.stack([self._landmarks_to_array(hand_landmarks) for hand_landmarks in hand_results.multi_hand_landmarks])
+        return self.process_hand_arrays(hand_points, handedness)
 
-    def process_hand_data(self, hand_results):
+    def process_hand_arrays(self, hand_points, handedness):
+        """hand_points: (手の数, 21, 3)の配列。両手の指の曲がり具合をまとめて計算する"""
         osc_params = {}
         info_for_gui = {}
         visualizer_data = {}
 
-        if not hand_results.multi_hand_landmarks:
+        if len(hand_points) == 0:
             return osc_params, info_for_gui, visualizer_data
 
+        settings = self.settings
         visualizer_data["hand_landmarks"] = {}
 
-        for hand_idx, hand_landmarks in enumerate(hand_results.multi_hand_landmarks):
-            handedness = hand_results.multi_handedness[hand_idx].classification[0].label
-            prefix = "Left" if handedness == "Left" else "Right"
-
-            thumb_curl = self._calculate_finger_curl(hand_landmarks, self.THUMB_TIP, self.THUMB_MCP, "thumb")
-            index_curl = self._calculate_finger_curl(hand_landmarks, self.INDEX_FINGER_TIP, self.INDEX_FINGER_MCP, "index")
-            middle_curl = self._calculate_finger_curl(hand_landmarks, self.MIDDLE_FINGER_TIP, self.MIDDLE_FINGER_MCP, "middle")
-            ring_curl = self._calculate_finger_curl(hand_landmarks, self.RING_FINGER_TIP, self.RING_FINGER_MCP, "ring")
-            pinky_curl = self._calculate_finger_curl(hand_landmarks, self.PINKY_TIP, self.PINKY_MCP, "pinky")
-
-            osc_params[f"/avatar/parameters/{prefix}HandThumbCurl"] = thumb_curl
-            osc_params[f"/avatar/parameters/{prefix}HandIndexCurl"] = index_curl
-            osc_params[f"/avatar/parameters/{prefix}HandMiddleCurl"] = middle_curl
-            osc_params[f"/avatar/parameters/{prefix}HandRingCurl"] = ring_curl
-            osc_params[f"/avatar/parameters/{prefix}HandPinkyCurl"] = pinky_curl
-
-            info_for_gui[f"{prefix}HandThumbCurl"] = thumb_curl
-            info_for_gui[f"{prefix}HandIndexCurl"] = index_curl
-            info_for_gui[f"{prefix}HandMiddleCurl"] = middle_curl
-            info_for_gui[f"{prefix}HandRingCurl"] = ring_curl
-            info_for_gui[f"{prefix}HandPinkyCurl"] = pinky_curl
-
-            fist_threshold, open_threshold = self.config.get_gesture_thresholds()
-            avg_curl = (thumb_curl + index_curl + middle_curl + ring_curl + pinky_curl) / 5.0
-
-            gesture_value = 2
-            if avg_curl > fist_threshold:
-                gesture_value = 1
-            elif avg_curl < open_threshold:
-                gesture_value = 0
+        # 指先とMCPのY座標の差から曲がり具合を計算 (手の数, 5)
+        current_y_diff = np.abs(hand_points[:, self.FINGER_TIPS, 1] - hand_points[:, self.FINGER_MCPS, 1])
+        curls = np.clip(1.0 - (current_y_diff - settings.curl_closed_y_diff) / (settings.curl_open_y_diff - settings.curl_closed_y_diff), 0.0, 1.0)
+
+        avg_curls = curls.mean(axis=1)
+        gestures = np.where(avg_curls > settings.gesture_fist_threshold, 1, np.where(avg_curls < settings.gesture_open_threshold, 0, 2))
+
+        for hand_idx, (hand_curls, gesture_value) in enumerate(zip(curls.tolist(), gestures.tolist())):
+            prefix = "Left" if handedness[hand_idx] == "Left" else "Right"
+
+            for finger_label, curl in zip(self.FINGER_LABELS, hand_curls):
+                osc_params[f"/avatar/parameters/{prefix}Hand{finger_label}Curl"] = curl
+                info_for_gui[f"{prefix}Hand{finger_label}Curl"] = curl
 
             osc_params[f"/avatar/parameters/Gesture{prefix}"] = gesture_value
             info_for_gui[f"Gesture{prefix}"] = gesture_value
 
-            visualizer_data["hand_landmarks"][prefix] = hand_landmarks.landmark
+            visualizer_data["hand_landmarks"][prefix] = hand_points[hand_idx]
 
         return osc_params, info_for_gui, visualizer_data
 
     def process_face_data(self, face_results):
-        osc_params = {}
-        info_for_gui = {}
-        visualizer_data = {}
-
         if not face_results.multi_face_landmarks:
-            return osc_params, info_for_gui, visualizer_data
-
-        for face_landmarks in face_results.multi_face_landmarks:
-            left_eye_upper = face_landmarks.landmark[self.LEFT_EYE_UPPER]
-            left_eye_lower = face_landmarks.landmark[self.LEFT_EYE_LOWER]
-            right_eye_upper = face_landmarks.landmark[self.RIGHT_EYE_UPPER]
-            right_eye_lower = face_landmarks.landmark[self.RIGHT_EYE_LOWER]
-
-            left_eye_distance = self._get_distance(left_eye_upper, left_eye_lower)
-            right_eye_distance = self._get_distance(right_eye_upper, right_eye_lower)
+            return {}, {}, {}
 
-            eye_open_threshold, eye_closed_threshold = self.config.get_eye_thresholds()
+        # max_num_faces=1なので最初の顔だけを使う。478点のうち使う6点だけを変換する
+        face_points = self._landmarks_to_array(face_results.multi_face_landmarks[0], indices=self.FACE_LANDMARKS)
+        return self._process_face_points(face_points[:3], face_points[3:])
 
-            left_eye_openness = (left_eye_distance - eye_closed_threshold) / (eye_open_threshold - eye_closed_threshold)
-            right_eye_openness = (right_eye_distance - eye_closed_threshold) / (eye_open_threshold - eye_closed_threshold)
+    def process_face_arrays(self, face_points):
+        """face_points: (468 or 478, 3)の配列。左目・右目・口の開き具合をまとめて計算する"""
+        return self._process_face_points(face_points[self.FACE_UPPER], face_points[self.FACE_LOWER])
 
-            left_eye_openness = max(0.0, min(1.0, left_eye_openness))
-            right_eye_openness = max(0.0, min(1.0, right_eye_openness))
-
-            osc_params["/avatar/parameters/EyeLidL"] = left_eye_openness
-            osc_params["/avatar/parameters/EyeLidR"] = right_eye_openness
-            info_for_gui["EyeLidL"] = left_eye_openness
-            info_for_gui["EyeLidR"] = right_eye_openness
+    def _process_face_points(self, upper_points, lower_points):
+        osc_params = {}
+        info_for_gui = {}
+        visualizer_data = {}
 
-            mouth_upper = face_landmarks.landmark[self.MOUTH_UPPER]
-            mouth_lower = face_landmarks.landmark[self.MOUTH_LOWER]
-            mouth_distance = self._get_distance(mouth_upper, mouth_lower)
+        settings = self.settings
+        open_thresholds = settings.face_open_thresholds
+        closed_thresholds = settings.face_closed_thresholds
 
-            mouth_open_threshold, mouth_closed_threshold = self.config.get_mouth_thresholds()
+        # 上下のランドマーク間の距離 (左目, 右目, 口)
+        distances = np.linalg.norm(upper_points - lower_points, axis=1)
+        openness = np.clip((distances - closed_thresholds) / (open_thresholds - closed_thresholds), 0.0, 1.0)
+        left_eye_openness, right_eye_openness, mouth_openness = openness.tolist()
 
-            mouth_openness = (mouth_distance - mouth_closed_threshold) / (mouth_open_threshold - mouth_closed_threshold)
-            mouth_openness = max(0.0, min(1.0, mouth_openness))
+        osc_params["/avatar/parameters/EyeLidL"] = left_eye_openness
+        osc_params["/avatar/parameters/EyeLidR"] = right_eye_openness
+        info_for_gui["EyeLidL"] = left_eye_openness
+        info_for_gui["EyeLidR"] = right_eye_openness
 
-            osc_params["/avatar/parameters/MouthOpen"] = mouth_openness
-            info_for_gui["MouthOpen"] = mouth_openness
+        osc_params["/avatar/parameters/MouthOpen"] = mouth_openness
+        info_for_gui["MouthOpen"] = mouth_openness
 
         return osc_params, info_for_gui, visualizer_data
 
     def process_pose_data(self, pose_results):
+        if not pose_results.pose_landmarks:
+            return {}, {}, {}
+
+        pose_points = self._landmarks_to_array(pose_results.pose_landmarks, with_visibility=True)
+        return self.process_pose_arrays(pose_points)
+
+    def process_pose_arrays(self, pose_points):
+        """pose_points: (33, 4)の配列 (x, y, z, visibility)。左右の腕をまとめて計算する"""
         osc_params = {}
         info_for_gui = {}
         visualizer_data = {}
-        
-        if not pose_results.pose_landmarks:
-            return osc_params, info_for_gui, visualizer_data
 
-        landmarks = pose_results.pose_landmarks.landmark
-        visualizer_data["pose_landmarks"] = landmarks
+        visualizer_data["pose_landmarks"] = pose_points
+
+        # 左右の順に並べた (2, 3) の配列
+        shoulders = pose_points[self.SHOULDERS, :3]
+        elbows = pose_points[self.ELBOWS, :3]
+        wrists = pose_points[self.WRISTS, :3]
 
-        # 肩の回転 (簡易的な例: 左右の肩のY座標の差をX軸回転にマッピング)
+        # 肩の回転 (簡易的な例)
         # VRChatのアバターに合わせて調整が必要
-        left_shoulder = landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER]
-        right_shoulder = landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER]
-        left_elbow = landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW]
-        right_elbow = landmarks[self.mp_pose.PoseLandmark.RIGHT_ELBOW]
-        left_wrist = landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST]
-        right_wrist = landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST]
-        
-        # 左肩の回転 (例: 肩と肘の相対位置から計算)
-        # X軸回転 (腕を前後に振る)
-        # Y軸回転 (腕を左右に開く)
-        # Z軸回転 (腕をひねる)
-        # ここでは簡易的に、肩と肘のY座標の差をX軸回転にマッピング
+        # X軸回転 (腕を前後に振る): 肘が肩より前にあるか後ろにあるかで判断
+        shoulder_x_angles = (elbows[:, 2] - shoulders[:, 2]) * 100 # 適当なスケール
+        # Y軸回転 (腕を左右に開く): 肘が肩より外側にあるか内側にあるかで判断
+        shoulder_y_angles = (elbows[:, 0] - shoulders[:, 0]) * 100
+        # Z軸回転 (腕をひねる) - 簡易版: 手首と肘のY座標の差をZ軸回転にマッピング
+        shoulder_z_angles = (wrists[:, 1] - elbows[:, 1]) * 100
         # 実際のVRChatアバターのボーン構造に合わせて、より複雑な計算が必要
-        
-        # 左肩のX軸回転 (腕を前後に振る)
-        # 肘が肩より前にあるか後ろにあるかで判断
-        left_shoulder_x_angle = (left_elbow.z - left_shoulder.z) * 100 # 適当なスケール
-        osc_params[self.config.get_arm_osc_parameter("left_shoulder_x_param")] = left_shoulder_x_angle
-        info_for_gui["LeftShoulderX"] = left_shoulder_x_angle
-
-        # 左肩のY軸回転 (腕を左右に開く)
-        # 肘が肩より外側にあるか内側にあるかで判断
-        left_shoulder_y_angle = (left_elbow.x - left_shoulder.x) * 100
-        osc_params[self.config.get_arm_osc_parameter("left_shoulder_y_param")] = left_shoulder_y_angle
-        info_for_gui["LeftShoulderY"] = left_shoulder_y_angle
-
-        # 左肩のZ軸回転 (腕をひねる) - 簡易版
-        # 手首と肘のY座標の差をZ軸回転にマッピング
-        left_shoulder_z_angle = (left_wrist.y - left_elbow.y) * 100
-        osc_params[self.config.get_arm_osc_parameter("left_shoulder_z_param")] = left_shoulder_z_angle
-        info_for_gui["LeftShoulderZ"] = left_shoulder_z_angle
-
-        # 右肩も同様
-        right_shoulder_x_angle = (right_elbow.z - right_shoulder.z) * 100
-        osc_params[self.config.get_arm_osc_parameter("right_shoulder_x_param")] = right_shoulder_x_angle
-        info_for_gui["RightShoulderX"] = right_shoulder_x_angle
-
-        right_shoulder_y_angle = (right_elbow.x - right_shoulder.x) * 100
-        osc_params[self.config.get_arm_osc_parameter("right_shoulder_y_param")] = right_shoulder_y_angle
-        info_for_gui["RightShoulderY"] = right_shoulder_y_angle
-
-        right_shoulder_z_angle = (right_wrist.y - right_elbow.y) * 100
-        osc_params[self.config.get_arm_osc_parameter("right_shoulder_z_param")] = right_shoulder_z_angle
-        info_for_gui["RightShoulderZ"] = right_shoulder_z_angle
-
-        # 肘の曲がり具合 (角度を計算)
-        # 左肘: 肩-肘-手首の角度
-        left_elbow_angle = self._calculate_angle(left_shoulder, left_elbow, left_wrist)
+
+        # 肘の曲がり具合: 肩-肘-手首の角度
         # 角度を0-1の範囲に正規化 (例: 180度(伸びている) -> 0, 0度(完全に曲がっている) -> 1)
         # 実際のVRChatアバターのブレンドシェイプやボーンの回転に合わせて調整
-        normalized_left_elbow_bend = (180 - left_elbow_angle) / 180.0
-        osc_params[self.config.get_arm_osc_parameter("left_elbow_bend_param")] = normalized_left_elbow_bend
-        info_for_gui["LeftElbowBend"] = normalized_left_elbow_bend
-
-        # 右肘も同様
-        right_elbow_angle = self._calculate_angle(right_shoulder, right_elbow, right_wrist)
-        normalized_right_elbow_bend = (180 - right_elbow_angle) / 180.0
-        osc_params[self.config.get_arm_osc_parameter("right_elbow_bend_param")] = normalized_right_elbow_bend
-        info_for_gui["RightElbowBend"] = normalized_right_elbow_bend
+        elbow_bends = (180 - self._calculate_angles(shoulders, elbows, wrists)) / 180.0
+
+        for label, addresses, shoulder_x, shoulder_y, shoulder_z, elbow_bend in zip(
+                ("Left", "Right"), self.settings.arm_osc_parameters, shoulder_x_angles.tolist(),
+                shoulder_y_angles.tolist(), shoulder_z_angles.tolist(), elbow_bends.tolist()):
+            shoulder_x_param, shoulder_y_param, shoulder_z_param, elbow_bend_param = addresses
+            osc_params[shoulder_x_param] = shoulder_x
+            osc_params[shoulder_y_param] = shoulder_y
+            osc_params[shoulder_z_param] = shoulder_z
+            osc_params[elbow_bend_param] = elbow_bend
+            info_for_gui[f"{label}ShoulderX"] = shoulder_x
+            info_for_gui[f"{label}ShoulderY"] = shoulder_y
+            info_for_gui[f"{label}ShoulderZ"] = shoulder_z
+            info_for_gui[f"{label}ElbowBend"] = elbow_bend
 
         return osc_params, info_for_gui, visualizer_data
 
-    def process_joycon_data(self, joycon_status):
+    def process_joycon_data(self, joycon_samples):
+        """Joy-Conごとの新しいサンプル (JOYCON_SAMPLE_DTYPEの配列) を処理する。サンプルが無い側は前回の値を使う"""
         osc_params = {}
         info_for_gui = {}
         visualizer_data = {}
         visualizer_data["joycon_orientations"] = {}
 
-        current_time = time.time()
-        dt = current_time - self.last_joycon_update_time
-        self.last_joycon_update_time = current_time
-
-        gyro_sensitivity = self.config.get_gyro_sensitivity()
-
-        if 'right' in joycon_status and joycon_status['right'] and 'gyro' in joycon_status['right']:
-            gyro_r = joycon_status['right']['gyro']
-            self.joycon_orientation_r[0] += math.radians(gyro_r[0]) * dt
-            self.joycon_orientation_r[1] += math.radians(gyro_r[1]) * dt
-            self.joycon_orientation_r[2] += math.radians(gyro_r[2]) * dt
-
-            osc_params["/avatar/parameters/RightHandYaw"] = self.joycon_orientation_r[2] * gyro_sensitivity
-            osc_params["/avatar/parameters/RightHandPitch"] = self.joycon_orientation_r[1] * gyro_sensitivity
-            osc_params["/avatar/parameters/RightHandRoll"] = self.joycon_orientation_r[0] * gyro_sensitivity
-            info_for_gui["RightHandYaw"] = self.joycon_orientation_r[2] * gyro_sensitivity
-            info_for_gui["RightHandPitch"] = self.joycon_orientation_r[1] * gyro_sensitivity
-            info_for_gui["RightHandRoll"] = self.joycon_orientation_r[0] * gyro_sensitivity
-            visualizer_data["joycon_orientations"]["Right"] = self.joycon_orientation_r
-
-        if 'left' in joycon_status and joycon_status['left'] and 'gyro' in joycon_status['left']:
-            gyro_l = joycon_status['left']['gyro']
-            self.joycon_orientation_l[0] += math.radians(gyro_l[0]) * dt
-            self.joycon_orientation_l[1] += math.radians(gyro_l[1]) * dt
-            self.joycon_orientation_l[2] += math.radians(gyro_l[2]) * dt
-
-            osc_params["/avatar/parameters/LeftHandYaw"] = self.joycon_orientation_l[2] * gyro_sensitivity
-            osc_params["/avatar/parameters/LeftHandPitch"] = self.joycon_orientation_l[1] * gyro_sensitivity
-            osc_params["/avatar/parameters/LeftHandRoll"] = self.joycon_orientation_l[0] * gyro_sensitivity
-            info_for_gui["LeftHandYaw"] = self.joycon_orientation_l[2] * gyro_sensitivity
-            info_for_gui["LeftHandPitch"] = self.joycon_orientation_l[1] * gyro_sensitivity
-            info_for_gui["LeftHandRoll"] = self.joycon_orientation_l[0] * gyro_sensitivity
-            visualizer_data["joycon_orientations"]["Left"] = self.joycon_orientation_l
-
-        if 'right' in joycon_status and joycon_status['right'] and 'stick' in joycon_status['right'] and joycon_status['right']['stick'] is not None:
-            stick_r = joycon_status['right']['stick']
-            osc_params["/avatar/parameters/RightStickX"] = stick_r[0]
-            osc_params["/avatar/parameters/RightStickY"] = stick_r[1]
-            info_for_gui["RightStickX"] = stick_r[0]
-            info_for_gui["RightStickY"] = stick_r[1]
-        
-        if 'left' in joycon_status and joycon_status['left'] and 'stick' in joycon_status['left'] and joycon_status['left']['stick'] is not None:
-            stick_l = joycon_status['left']['stick']
-            osc_params["/avatar/parameters/LeftStickX"] = stick_l[0]
-            osc_params["/avatar/parameters/LeftStickY"] = stick_l[1]
-            info_for_gui["LeftStickX"] = stick_l[0]
-            info_for_gui["LeftStickY"] = stick_l[1]
-
-        if 'right' in joycon_status and joycon_status['right'] and 'buttons' in joycon_status['right']:
-            buttons_r = joycon_status['right']['buttons']
+        gyro_sensitivity = self.settings.gyro_sensitivity
+        imu_accel_gain = self.settings.imu_accel_gain
+
+        for side, label in (("right", "Right"), ("left", "Left")):
+            if side not in joycon_samples:
+                continue
+            samples = joycon_samples[side]
+            fusion = self.joycon_fusions[side]
+            if len(samples):
+                # 全サンプルをそれぞれの時刻で積分する (カメラのフレームレートには依存しない)
+                fusion.update(samples, imu_accel_gain)
+                # samplesはSampleRingのバッファを参照しているので、リングが一周して上書きされないようにコピーして持つ
+                self.latest_joycon_samples[side] = samples[-1].copy()
+
+            latest = self.latest_joycon_samples.get(side)
+            if latest is None:
+                continue
+
+            orientation = fusion.euler()
+            roll, pitch, yaw = (angle * gyro_sensitivity for angle in orientation)
+            osc_params[f"/avatar/parameters/{label}HandYaw"] = yaw
+            osc_params[f"/avatar/parameters/{label}HandPitch"] = pitch
+            osc_params[f"/avatar/parameters/{label}HandRoll"] = roll
+            info_for_gui[f"{label}HandYaw"] = yaw
+            info_for_gui[f"{label}HandPitch"] = pitch
+            info_for_gui[f"{label}HandRoll"] = roll
+            visualizer_data["joycon_orientations"][label] = list(orientation)
+
+            stick_x, stick_y = latest['stick'].tolist()
+            osc_params[f"/avatar/parameters/{label}StickX"] = stick_x
+            osc_params[f"/avatar/parameters/{label}StickY"] = stick_y
+            info_for_gui[f"{label}StickX"] = stick_x
+            info_for_gui[f"{label}StickY"] = stick_y
+
+            buttons = int(latest['buttons'])
             button_info = {}
-            for button_name, is_pressed in buttons_r.items():
-                osc_params[f"/avatar/parameters/RightJoyConButton{button_name}"] = is_pressed
+            for button_name, bit in JOYCON_BUTTONS[side]:
+                is_pressed = bool((buttons >> bit) & 1)
+                osc_params[f"/avatar/parameters/{label}JoyConButton{button_name}"] = is_pressed
                 button_info[button_name] = is_pressed
-            info_for_gui["RightJoyConButtons"] = button_info
+            info_for_gui[f"{label}JoyConButtons"] = button_info
 
-        if 'left' in joycon_status and joycon_status['left'] and 'buttons' in joycon_status['left']:
-            buttons_l = joycon_status['left']['buttons']
-            button_info = {}
-            for button_name, is_pressed in buttons_l.items():
-                osc_params[f"/avatar/parameters/LeftJoyConButton{button_name}"] = is_pressed
-                button_info[button_name] = is_pressed
-            info_for_gui["LeftJoyConButtons"] = button_info
-
-        return osc_params, info_for_gui, visualizer_data
\ No newline at end of file
+        return osc_params, info_for_gui, visualizer_data
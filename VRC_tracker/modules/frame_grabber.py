@@ -0,0 +1,53 @@
+import threading
+import time
+
+class FrameGrabber(threading.Thread):
+    """カメラ読み込み専用スレッド。最新フレームを1枠だけ保持し、古いフレームは上書きして捨てる"""
+
+    def __init__(self, cap):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.running = True
+
+        # 最新フレームのスロット (frame, キャプチャ時刻, シーケンス番号)
+        self._condition = threading.Condition()
+        self._frame = None
+        self._timestamp = 0.0
+        self._seq = 0
+
+        self.dropped_frames = 0 # 推論側に読まれずに上書きされたフレーム数
+        self._last_read_seq = 0
+
+    def run(self):
+        while self.running:
+            success, frame = self.cap.read()
+            timestamp = time.monotonic()
+            if not success:
+                print("Warning: Failed to read frame from camera.")
+                time.sleep(0.1)
+                continue
+
+            with self._condition:
+                if self._seq > self._last_read_seq:
+                    self.dropped_frames += 1
+                self._frame = frame
+                self._timestamp = timestamp
+                self._seq += 1
+                self._condition.notify_all()
+
+    def get_latest(self, last_seq=0, timeout=1.0):
+        """last_seqより新しいフレームが来るまで待ち、最新のものだけを返す"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._seq > last_seq or not self.running, timeout):
+                return None, 0.0, last_seq
+            if self._frame is None:
+                return None, 0.0, last_seq
+            self._last_read_seq = self._seq
+            return self._frame, self._timestamp, self._seq
+
+    def stop(self):
+        self.running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self.is_alive():
+            self.join(timeout=1.0)
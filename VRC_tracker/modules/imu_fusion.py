@@ -0,0 +1,111 @@
+import math
+import numpy as np
+
+MAX_SAMPLE_INTERVAL = 0.1 # 再接続などで空いた時間はこれ以上積分しない (秒)
+GRAVITY_TOLERANCE = 0.15 # 加速度の大きさが1G±これの範囲のサンプルだけを重力の向きとして使う
+
+def quaternion_multiply(a, b):
+    """(w, x, y, z) の四元数の積。1サンプルごとに呼ぶので、小さな配列を作らずにfloatのまま計算する"""
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+    return (
+        aw * bw - ax * bx - ay * by - az * bz,
+        aw * bx + ax * bw + ay * bz - az * by,
+        aw * by - ax * bz + ay * bw + az * bx,
+        aw * bz + ax * by - ay * bx + az * bw,
+    )
+
+def quaternion_conjugate(q):
+    w, x, y, z = q
+    return (w, -x, -y, -z)
+
+def quaternion_to_euler(q):
+    """(ロール, ピッチ, ヨー) [rad]。Z-Y-Xの順の回転として分解する"""
+    w, x, y, z = q
+    roll = math.atan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    pitch = math.asin(max(-1.0, min(1.0, 2.0 * (w * y - z * x))))
+    yaw = math.atan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    return roll, pitch, yaw
+
+def _normalize(q):
+    norm = math.sqrt(sum(v * v for v in q))
+    return tuple(v / norm for v in q)
+
+def _tilt_quaternion(accel):
+    # 静止時の加速度 (重力の反作用) から、ヨーを0としたロールとピッチだけの姿勢を求める
+    ax, ay, az = accel.tolist()
+    half_roll = math.atan2(ay, az) / 2.0
+    half_pitch = math.atan2(-ax, math.hypot(ay, az)) / 2.0
+    return quaternion_multiply(
+        (math.cos(half_pitch), 0.0, math.sin(half_pitch), 0.0),
+        (math.cos(half_roll), math.sin(half_roll), 0.0, 0.0),
+    )
+
+class ImuFusion:
+    """Joy-Con 1台分の姿勢を四元数で持ち、IMUサンプルをそれぞれの時刻で積分する相補フィルタ (Mahony型)。
+    ジャイロで回転を積分し、加速度から求めた重力の向きとのずれでロールとピッチのドリフトを補正する (ヨーは補正できない)"""
+
+    def __init__(self):
+        self.orientation = (1.0, 0.0, 0.0, 0.0) # (w, x, y, z) センサー座標 -> 世界座標 (Z軸が上)
+        self.reference = None # リセンター時の姿勢。出力はこれに対する相対姿勢
+        self.last_time = None
+        self.recenter_requested = False # 別スレッドから呼ばれるので、次のupdateで反映する
+
+    def recenter(self):
+        """現在の姿勢を正面 (ヨー・ピッチ・ロールすべて0) にする"""
+        self.recenter_requested = True
+
+    def update(self, samples, accel_gain=0.5):
+        """JOYCON_SAMPLE_DTYPEの配列を時刻順に積分する。accel_gainは重力の向きへの補正の強さ [rad/s]"""
+        if not len(samples):
+            return
+        timestamps = samples['timestamp']
+        if self.last_time is None:
+            # 最初のサンプルでは積分せず、重力の向きから初期姿勢を決めて正面にする
+            accel = samples['accel'][0]
+            if abs(float(np.linalg.norm(accel)) - 1.0) < GRAVITY_TOLERANCE:
+                self.orientation = _tilt_quaternion(accel)
+            self.reference = self.orientation
+            self.last_time = float(timestamps[0])
+
+        dts = np.clip(np.diff(timestamps, prepend=self.last_time), 0.0, MAX_SAMPLE_INTERVAL)
+        self.last_time = float(timestamps[-1])
+        omega = np.radians(samples['gyro'].astype(np.float64)) # (N, 3) rad/s
+
+        # 重力の向きとのずれはバッチの先頭の姿勢でまとめて求め、バッチ内の全サンプルの角速度に加える
+        accel = samples['accel'].astype(np.float64)
+        norms = np.linalg.norm(accel, axis=1)
+        valid = np.abs(norms - 1.0) < GRAVITY_TOLERANCE
+        if accel_gain > 0.0 and valid.any():
+            mx, my, mz = (accel[valid] / norms[valid, None]).mean(axis=0).tolist()
+            w, x, y, z = self.orientation
+            # 現在の姿勢から予測される、センサー座標での上向き
+            ex, ey, ez = 2.0 * (x * z - w * y), 2.0 * (w * x + y * z), w * w - x * x - y * y + z * z
+            # 測った向きと予測した向きの外積の方向に回して、ずれを小さくする
+            omega = omega + accel_gain * np.array([my * ez - mz * ey, mz * ex - mx * ez, mx * ey - my * ex])
+
+        # 各サンプルの回転 (角速度 x サンプル間隔) をまとめて四元数にする
+        rotation = omega * dts[:, None]
+        angles = np.linalg.norm(rotation, axis=1)
+        half = angles / 2.0
+        # 角度が0に近い時は sin(θ/2)/θ -> 1/2
+        scale = np.where(angles > 1e-9, np.sin(half) / np.maximum(angles, 1e-9), 0.5)
+        deltas = np.concatenate([np.cos(half)[:, None], rotation * scale[:, None]], axis=1)
+
+        orientation = self.orientation
+        for delta in deltas.tolist():
+            orientation = quaternion_multiply(orientation, delta)
+        self.orientation = _normalize(orientation)
+
+        if self.recenter_requested:
+            self.recenter_requested = False
+            self.reference = self.orientation
+
+    def relative_orientation(self):
+        if self.reference is None:
+            return self.orientation
+        return quaternion_multiply(quaternion_conjugate(self.reference), self.orientation)
+
+    def euler(self):
+        """リセンターした姿勢に対する (ロール, ピッチ, ヨー) [rad]"""
+        return quaternion_to_euler(self.relative_orientation())
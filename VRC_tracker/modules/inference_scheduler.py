@@ -0,0 +1,22 @@
+class InferenceScheduler:
+    """モデルごとの目標レート(Hz)に従って、そのフレームで推論すべきモデルを決める"""
+
+    def __init__(self, rates):
+        self.intervals = {}
+        self.next_due = {name: 0.0 for name in rates}
+        self.set_rates(rates)
+
+    def set_rates(self, rates):
+        # rate <= 0 は毎フレーム推論する。次回の予定時刻はそのまま残す
+        self.intervals.update({name: (1.0 / rate if rate > 0 else 0.0) for name, rate in rates.items()})
+
+    def due_models(self, now):
+        return [name for name, next_due in self.next_due.items() if now >= next_due]
+
+    def mark_run(self, name, now):
+        interval = self.intervals[name]
+        # 前回の予定時刻から進めることで平均レートを保つ。1周期以上遅れた場合は現在時刻からやり直す
+        next_due = self.next_due[name] + interval
+        if next_due < now:
+            next_due = now + interval
+        self.next_due[name] = next_due
@@ -0,0 +1,320 @@
+import multiprocessing
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+import numpy as np
+
+from modules.camera_tracker import CameraTracker
+from modules.latency_tracer import FrameTrace
+from modules.session_recorder import FRAME_DTYPE, HANDEDNESS_LABELS, fill_frame_record
+
+MODEL_NAMES = ("hands", "face", "pose")
+RING_SIZE = 4 # 共有メモリに置くフレーム数。読み手はこのフレーム数だけ遅れても上書きされる前に読める
+# 共有メモリ上の1フレーム分のスロット。ランドマークは記録と同じFRAME_DTYPEで持つ
+SLOT_DTYPE = np.dtype([
+    ('seq', 'u8'), # 書き込み中は0
+    ('record', FRAME_DTYPE),
+    ('hand_scores', 'f4', (2,)), # 手ごとの左右判定の確信度 (複数カメラの結果をまとめる時に使う)
+    ('model_runs', 'u8', (len(MODEL_NAMES),)), # モデルごとの推論回数。読み手はこの差から推論し直したモデルを知る
+    ('inference_start', 'f8'), # FrameTraceの推論時刻 (推論しなかったフレームは0)
+    ('inference', 'f8', (len(MODEL_NAMES), 2)),
+])
+HEADER_SIZE = 8 # 最後に書き込んだスロットのシーケンス番号 (u8)
+
+class SharedFrameRing:
+    """共有メモリ上のフレームとランドマークのリングバッファ。ワーカーが作って書き込み、TrackingThread側は名前で開いて読む"""
+
+    def __init__(self, frame_shape, name=None):
+        self.frame_shape = tuple(frame_shape)
+        frame_size = int(np.prod(self.frame_shape))
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + (SLOT_DTYPE.itemsize + frame_size) * RING_SIZE)
+        else:
+            # spawnしたワーカーとはresource_trackerを共有しているので、開いた側で登録を外す必要はない
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        self.header = np.ndarray(1, dtype=np.uint64, buffer=self.shm.buf)
+        self.slots = np.ndarray(RING_SIZE, dtype=SLOT_DTYPE, buffer=self.shm.buf, offset=HEADER_SIZE)
+        self.frames = np.ndarray((RING_SIZE,) + self.frame_shape, dtype=np.uint8, buffer=self.shm.buf,
+                                 offset=HEADER_SIZE + SLOT_DTYPE.itemsize * RING_SIZE)
+        if self.owner:
+            self.header[0] = 0
+            self.slots['seq'] = 0
+        self.seq = 0
+        self.model_runs = np.zeros(len(MODEL_NAMES), dtype=np.uint64)
+
+    def write(self, frame, timestamp, hand_results, face_results, pose_results, updated_models, trace):
+        """CameraTracker.get_landmarksの結果を次のスロットに書き込む (ワーカー側)"""
+        self.seq += 1
+        index = self.seq % RING_SIZE
+        slot = self.slots[index:index + 1]
+        slot['seq'] = 0
+        fill_frame_record(slot['record'], timestamp, hand_results, face_results, pose_results, updated_models)
+        self.frames[index] = frame
+
+        slot['hand_scores'] = 0.0
+        if hand_results and hand_results.multi_handedness:
+            scores = [handedness.classification[0].score for handedness in hand_results.multi_handedness[:2]]
+            slot['hand_scores'][0, :len(scores)] = scores
+        for i, name in enumerate(MODEL_NAMES):
+            if name in updated_models:
+                self.model_runs[i] += 1
+        slot['model_runs'] = self.model_runs
+        slot['inference_start'] = trace.inference_start or 0.0
+        slot['inference'] = [trace.inference.get(name, (0.0, 0.0)) for name in MODEL_NAMES]
+
+        # 中身を書き終えてからシーケンス番号を公開する
+        slot['seq'] = self.seq
+        self.header[0] = self.seq
+
+    def read(self, last_seq):
+        """last_seqより新しい最新のスロットを (シーケンス番号, スロットのコピー, フレーム) で返す。無ければNone。
+        フレームはコピーしないので、RING_SIZEフレーム後に上書きされるまでの間だけ使える"""
+        for _ in range(RING_SIZE):
+            seq = int(self.header[0])
+            if seq <= last_seq:
+                return None
+            index = seq % RING_SIZE
+            slot = self.slots[index:index + 1].copy()
+            # コピーしている間に上書きされていなければ使う (されていれば最新のスロットを読み直す)
+            if int(slot['seq'][0]) == seq and int(self.slots['seq'][index]) == seq:
+                return seq, slot[0], self.frames[index]
+        return None
+
+    def close(self):
+        # 共有メモリを閉じる前に、バッファを参照している配列を消す
+        del self.header, self.slots, self.frames
+        try:
+            self.shm.close()
+        except BufferError:
+            pass # 返したフレームがまだ使われていれば、参照が無くなった時に解放される
+        if self.owner:
+            self.shm.unlink()
+
+class _Landmark:
+    __slots__ = ("x", "y", "z", "visibility")
+
+    def __init__(self, x, y, z, visibility=None):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.visibility = visibility
+
+    def HasField(self, name):
+        # MediaPipeの描画ユーティリティがprotobufのメッセージと同じように呼ぶ
+        return name == "visibility" and self.visibility is not None
+
+class LandmarkArray:
+    """MediaPipeのNormalizedLandmarkListと同じように読める、ランドマークの配列。
+    DataProcessorと記録はpointsをそのまま使い、landmarkはプレビューを描画する時だけ作る"""
+
+    def __init__(self, points):
+        self.points = points
+        self._landmark = None
+
+    @property
+    def landmark(self):
+        if self._landmark is None:
+            self._landmark = [_Landmark(*point) for point in self.points.tolist()]
+        return self._landmark
+
+def results_from_record(record, hand_scores=(1.0, 1.0)):
+    """FRAME_DTYPEのレコードから、MediaPipeの推論結果と同じ属性を持つ (hand_results, face_results, pose_results) を作る"""
+    hand_count = int(record['hand_count'])
+    hand_results = SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+    if hand_count:
+        hand_results.multi_hand_landmarks = [LandmarkArray(record['hands'][i]) for i in range(hand_count)]
+        hand_results.multi_handedness = [
+            SimpleNamespace(classification=[SimpleNamespace(label=HANDEDNESS_LABELS[label], score=float(score))])
+            for label, score in zip(record['handedness'][:hand_count], hand_scores)
+        ]
+    face_results = SimpleNamespace(multi_face_landmarks=[LandmarkArray(record['face'])] if record['face_present'] else None)
+    pose_results = SimpleNamespace(pose_landmarks=LandmarkArray(record['pose']) if record['pose_present'] else None)
+    return hand_results, face_results, pose_results
+
+def _set_cpu_affinity(cpus):
+    if not cpus:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        print("Warning: Pinning the inference worker to CPUs is not supported on this platform.")
+        return
+    try:
+        os.sched_setaffinity(0, cpus)
+        print(f"Inference worker pinned to CPUs {sorted(cpus)}.")
+    except OSError as e:
+        print(f"Could not pin the inference worker to CPUs {cpus}: {e}")
+
+def _run_worker(control, status, frame_ready, tracker_kwargs, cpu_affinity):
+    """ワーカープロセスの本体。CameraTrackerでキャプチャと推論を行い、結果を共有メモリに書き込む"""
+    _set_cpu_affinity(cpu_affinity)
+    tracker = CameraTracker(**tracker_kwargs)
+    status.put(("camera", tracker.cap is not None))
+    ring = None
+    try:
+        while True:
+            try:
+                while True:
+                    name, *args = control.get_nowait()
+                    if name == "stop":
+                        return
+                    # TrackingThreadから呼ばれたCameraTrackerのメソッドをそのまま呼ぶ
+                    result = getattr(tracker, name)(*args)
+                    if name in ("open_camera", "reopen_camera"):
+                        status.put(("camera", bool(result)))
+            except queue.Empty:
+                pass
+
+            hand_results, face_results, pose_results, frame = tracker.get_landmarks()
+            if frame is None:
+                if tracker.cap is None:
+                    time.sleep(0.01)
+                continue
+
+            # 解像度が変わったら共有メモリを作り直して、新しい名前を知らせる
+            if ring is None or ring.frame_shape != frame.shape:
+                old_ring = ring
+                ring = SharedFrameRing(frame.shape)
+                status.put(("ring", ring.name, ring.frame_shape))
+                if old_ring:
+                    old_ring.close()
+            ring.write(frame, tracker.frame_timestamp, hand_results, face_results, pose_results,
+                       tracker.updated_models, tracker.trace)
+            frame_ready.set()
+    finally:
+        tracker.release()
+        if ring:
+            ring.close()
+
+class RemoteCameraTracker:
+    """CameraTrackerと同じように使える、キャプチャと推論を別プロセスで行うトラッカー。
+    推論結果はpickleせずに共有メモリのリングバッファで受け取るので、GUIやVisualizerがGILを握ってもトラッキングは止まらない"""
+
+    def __init__(self, cpu_affinity=None, frame_ready=None, **tracker_kwargs):
+        self.frame_seq = 0
+        self.frame_timestamp = 0.0
+        self.trace = None
+        self.updated_models = set()
+        self.camera_open = True # ワーカーがカメラを開けなかったと知らせてくるまでは開けたものとして扱う
+        self.ring = None
+        self.model_runs = None # 前回読んだスロットのモデルごとの推論回数
+
+        # 親プロセスのスレッドを引き継がないようにspawnで起動する (Windowsと同じ動作になる)
+        context = multiprocessing.get_context("spawn")
+        self.control = context.Queue()
+        self.status = context.Queue()
+        # 複数のワーカーで1つのEventを共有すると、どれかのフレームが届くまでまとめて待てる
+        self.frame_ready = frame_ready or context.Event()
+        self.process = context.Process(
+            target=_run_worker, name="inference-worker", daemon=True,
+            args=(self.control, self.status, self.frame_ready, tracker_kwargs, cpu_affinity)
+        )
+        self.process.start()
+
+    @property
+    def cap(self):
+        # TrackingThreadはカメラを開けているかをcapがNoneかどうかで判定する
+        return True if self.camera_open else None
+
+    def _call(self, name, *args):
+        self.control.put((name,) + args)
+
+    def open_camera(self, device_id, camera_probe=None):
+        self.camera_open = True
+        self._call("open_camera", device_id, camera_probe)
+        return True
+
+    def reopen_camera(self):
+        self.camera_open = True
+        self._call("reopen_camera")
+        return True
+
+    def set_capture_format(self, capture_format):
+        self._call("set_capture_format", capture_format)
+
+    def set_inference_widths(self, inference_widths):
+        self._call("set_inference_widths", inference_widths)
+
+    def set_pose_confidence(self, min_detection_confidence, min_tracking_confidence):
+        self._call("set_pose_confidence", min_detection_confidence, min_tracking_confidence)
+
+    def set_parallel_inference(self, enabled):
+        self._call("set_parallel_inference", enabled)
+
+    def set_inference_rates(self, rates):
+        self._call("set_inference_rates", rates)
+
+    def set_motion_detector(self, motion_detector):
+        self._call("set_motion_detector", motion_detector)
+
+    def _poll_status(self, timeout):
+        while True:
+            try:
+                message = self.status.get(timeout=timeout) if timeout else self.status.get_nowait()
+            except queue.Empty:
+                return
+            timeout = 0.0
+            if message[0] == "camera":
+                self.camera_open = message[1]
+            elif message[0] == "ring":
+                _, name, frame_shape = message
+                if self.ring:
+                    self.ring.close()
+                self.ring = SharedFrameRing(frame_shape, name=name)
+                self.frame_seq = 0
+                self.model_runs = None
+
+    def get_landmarks(self):
+        # 共有メモリができるまでは、ワーカーからの知らせを待つ
+        self._poll_status(0.0 if self.ring else 0.1)
+        if self.ring is None:
+            return None, None, None, None
+        if self.frame_ready.wait(1.0):
+            self.frame_ready.clear()
+        return self.read_latest()
+
+    def read_latest(self):
+        """待たずに、前回読んでから書き込まれた最新のフレームの結果を返す"""
+        self._poll_status(0.0)
+        if self.ring is None:
+            return None, None, None, None
+        result = self.ring.read(self.frame_seq)
+        if result is None:
+            return None, None, None, None
+
+        seq, slot, frame = result
+        record = slot['record']
+        self.frame_seq = seq
+        self.frame_timestamp = float(record['timestamp'])
+        trace = FrameTrace(seq, self.frame_timestamp)
+        self.trace = trace
+
+        # 読み飛ばしたスロットで推論したモデルも、推論し直したものとして扱う
+        model_runs = slot['model_runs']
+        self.updated_models = {name for i, name in enumerate(MODEL_NAMES)
+                               if self.model_runs is None or model_runs[i] != self.model_runs[i]}
+        self.model_runs = model_runs
+        if slot['inference_start'] > 0.0:
+            trace.inference_start = float(slot['inference_start'])
+            for i, name in enumerate(MODEL_NAMES):
+                start, end = slot['inference'][i].tolist()
+                if end > 0.0:
+                    trace.inference[name] = (start, end)
+
+        hand_results, face_results, pose_results = results_from_record(record, slot['hand_scores'].tolist())
+        return hand_results, face_results, pose_results, frame
+
+    def release(self):
+        if self.process.is_alive():
+            self._call("stop")
+            self.process.join(timeout=3.0)
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+        print("Inference worker stopped.")
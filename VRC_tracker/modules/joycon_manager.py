@@ -1,63 +1,153 @@
 from pyjoycon import JoyCon, get_L_id, get_R_id # ここを変更
 import threading
 import time
+import numpy as np
 
-class JoyConManager:
-    def __init__(self):
-        self.joycon_l = None
-        self.joycon_r = None
-        self.status_l = {}
-        self.status_r = {}
-        self.lock_l = threading.Lock()
-        self.lock_r = threading.Lock()
+from modules.joycon_ring import JOYCON_SAMPLE_DTYPE, SampleRing
 
-        try:
-            l_id = get_L_id()
-            if l_id:
-                self.joycon_l = JoyCon(*l_id)
-                print("Left Joy-Con connected.")
-                threading.Thread(target=self._read_joycon_data, args=(self.joycon_l, self.status_l, self.lock_l), daemon=True).start()
-            else:
-                print("Left Joy-Con not found.")
-        except (ValueError, TypeError, Exception) as e:
-            print(f"Error connecting Left Joy-Con: {e}")
+GYRO_DEG_PER_COUNT = 0.06103 # ±2000dps (pyjoycon の gyro_in_deg と同じ係数)
+ACCEL_G_PER_COUNT = 4.0 / 0x4000 # ±8G
+SAMPLE_INTERVAL = 0.005 # 1レポート内のIMUサンプルの間隔 (秒)
+STICK_CENTER = 2048.0 # 12bitのスティック値の中央 (キャリブレーション値は読んでいない)
+READ_TIMEOUT_MS = 100 # 受信スレッドの読み込みのタイムアウト。停止を要求されたらこの時間以内に抜ける
 
-        try:
-            r_id = get_R_id()
-            if r_id:
-                self.joycon_r = JoyCon(*r_id)
-                print("Right Joy-Con connected.")
-                threading.Thread(target=self._read_joycon_data, args=(self.joycon_r, self.status_r, self.lock_r), daemon=True).start()
-            else:
-                print("Right Joy-Con not found.")
-        except (ValueError, TypeError, Exception) as e:
-            print(f"Error connecting Right Joy-Con: {e}")
-
-    def _read_joycon_data(self, joycon_instance, status_dict, lock):
-        while True:
+class RingBufferJoyCon(JoyCon):
+    """pyjoyconの受信スレッドを置き換え、入力レポートを受信した時刻で記録してSampleRingに書き込む"""
+
+    def __init__(self, vendor_id, product_id, serial=None, side="right", ring=None):
+        # JoyCon.__init__の最後で受信スレッドが起動するので、先に状態を用意しておく
+        self.side = side
+        self.ring = ring or SampleRing()
+        self.running = True
+        self.error_count = 0
+        self.reconnect_count = 0
+        self._records = np.zeros(3, dtype=JOYCON_SAMPLE_DTYPE) # 毎レポート確保せずに使い回す
+        self._imu_offset = None
+        self._imu_scale = None
+        super().__init__(vendor_id, product_id, serial)
+
+    def _setup_imu_scale(self):
+        # 左のJoy-ConはY/Z軸の向きが逆 (pyjoyconのPythonicJoyConと同じ補正)
+        yz = -1.0 if self.is_left() else 1.0
+        axis = np.array([1.0, yz, yz])
+        self._imu_offset = np.array([
+            self._ACCEL_OFFSET_X, self._ACCEL_OFFSET_Y, self._ACCEL_OFFSET_Z,
+            self._GYRO_OFFSET_X, self._GYRO_OFFSET_Y, self._GYRO_OFFSET_Z,
+        ])
+        self._imu_scale = np.concatenate([
+            np.array([self._ACCEL_COEFF_X, self._ACCEL_COEFF_Y, self._ACCEL_COEFF_Z]) * axis * ACCEL_G_PER_COUNT,
+            np.array([self._GYRO_COEFF_X, self._GYRO_COEFF_Y, self._GYRO_COEFF_Z]) * axis * GYRO_DEG_PER_COUNT,
+        ])
+
+    def _update_input_report(self): # pyjoyconの受信スレッド (daemon)
+        failures = 0
+        while self.running:
             try:
-                current_status = joycon_instance.get_status()
-                with lock:
-                    status_dict.update(current_status)
+                # 次のレポートが届くまで待つ。stopでデバイスを閉じる前にスレッドが抜けられるようにタイムアウトを付ける
+                report = bytes(self._joycon_device.read(self._INPUT_REPORT_SIZE, READ_TIMEOUT_MS))
             except Exception as e:
-                print(f"Error reading Joy-Con data: {e}")
-                break
-            time.sleep(0.01)
-
-    def get_status(self):
-        combined_status = {}
-        with self.lock_l:
-            if self.status_l:
-                combined_status['left'] = self.status_l.copy()
-        with self.lock_r:
-            if self.status_r:
-                combined_status['right'] = self.status_r.copy()
-        return combined_status
+                if not self.running:
+                    break
+                # 一時的なエラーではスレッドを終了せず、続くようなら開き直す
+                self.error_count += 1
+                failures += 1
+                if failures == 1:
+                    print(f"Error reading {self.side} Joy-Con: {e}")
+                time.sleep(min(0.05 * failures, 1.0))
+                if failures % 10 == 0:
+                    self._reconnect()
+                continue
+            if not report:
+                continue # タイムアウト (レポートが届いていない)
+            timestamp = time.monotonic()
+
+            if len(report) < self._INPUT_REPORT_SIZE or report[0] != 0x30:
+                continue
+            failures = 0
+            self._input_report = report
+            self._push_report(report, timestamp)
+
+            for callback in self._input_hooks:
+                try:
+                    callback(self)
+                except Exception as e:
+                    print(f"Joy-Con update hook error: {e}")
+
+    def _push_report(self, report, timestamp):
+        if self._imu_scale is None:
+            self._setup_imu_scale()
+        # 3サンプル x (加速度XYZ, ジャイロXYZ) のint16。古いサンプルから順に並んでいる
+        raw = np.frombuffer(report, dtype='<i2', count=18, offset=13).reshape(3, 6)
+        imu = (raw - self._imu_offset) * self._imu_scale
+
+        if self.is_left():
+            stick_raw = (report[6] | ((report[7] & 0x0F) << 8), (report[7] >> 4) | (report[8] << 4))
+        else:
+            stick_raw = (report[9] | ((report[10] & 0x0F) << 8), (report[10] >> 4) | (report[11] << 4))
+
+        records = self._records
+        records['timestamp'] = timestamp - SAMPLE_INTERVAL * np.arange(2, -1, -1)
+        records['accel'] = imu[:, :3]
+        records['gyro'] = imu[:, 3:]
+        records['buttons'] = report[3] | (report[4] << 8) | (report[5] << 16)
+        records['stick'] = np.clip((np.array(stick_raw) - STICK_CENTER) / STICK_CENTER, -1.0, 1.0)
+        records['battery'] = report[2] >> 4
+        self.ring.push(records)
+
+    def _reconnect(self):
+        try:
+            self._close()
+            self._joycon_device = self._open(self.vendor_id, self.product_id, self.serial)
+            self._setup_sensors()
+            self.reconnect_count += 1
+            print(f"{self.side.capitalize()} Joy-Con reconnected.")
+        except Exception as e:
+            print(f"Reconnecting {self.side} Joy-Con failed: {e}")
+
+    def stop(self):
+        self.running = False
+        # 読み込み中のデバイスを閉じないように、受信スレッドが抜けるのを待ってから閉じる
+        self._update_input_report_thread.join()
+        self._close()
+
+class JoyConManager:
+    def __init__(self, ring_capacity=1024):
+        self.joycons = {} # "left" / "right" -> RingBufferJoyCon
+        self.rings = {}
+        self.cursors = {} # 最後に読んだ位置 (読み手は出力スレッドだけ)
+
+        for side, get_id in (("left", get_L_id), ("right", get_R_id)):
+            label = side.capitalize()
+            try:
+                joycon_id = get_id()
+                # 見つからない時は (None, None, None) が返る
+                if joycon_id and joycon_id[0] is not None:
+                    ring = SampleRing(ring_capacity)
+                    self.joycons[side] = RingBufferJoyCon(*joycon_id, side=side, ring=ring)
+                    self.rings[side] = ring
+                    self.cursors[side] = 0
+                    print(f"{label} Joy-Con connected.")
+                else:
+                    print(f"{label} Joy-Con not found.")
+            except (ValueError, TypeError, Exception) as e:
+                print(f"Error connecting {label} Joy-Con: {e}")
+
+    def read_new_samples(self):
+        """接続中のJoy-Conごとに、前回呼んでから届いたサンプル (リングバッファのビュー) を返す"""
+        samples = {}
+        for side, ring in self.rings.items():
+            samples[side], self.cursors[side] = ring.read_since(self.cursors[side])
+        return samples
+
+    def is_receiving(self, side, now, timeout=1.0):
+        ring = self.rings.get(side)
+        latest = ring.latest() if ring else None
+        return latest is not None and now - latest['timestamp'] < timeout
 
     def disconnect(self):
-        if self.joycon_l:
-            self.joycon_l.close()
-            print("Left Joy-Con disconnected.")
-        if self.joycon_r:
-            self.joycon_r.close()
-            print("Right Joy-Con disconnected.")
\ No newline at end of file
+        for side, joycon in self.joycons.items():
+            joycon.stop()
+            print(f"{side.capitalize()} Joy-Con disconnected.")
+        self.joycons = {}
+        self.rings = {}
+        self.cursors = {}
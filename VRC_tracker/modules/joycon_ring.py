@@ -0,0 +1,56 @@
+import numpy as np
+
+# Joy-ConのIMUサンプル1つ分の固定長レコード。入力レポート(0x30)1つに3サンプル (5ms間隔) 入っている
+JOYCON_SAMPLE_DTYPE = np.dtype([
+    ('timestamp', 'f8'), # 受信時刻から求めたサンプル時刻 (time.monotonic)
+    ('accel', 'f4', (3,)), # G
+    ('gyro', 'f4', (3,)), # deg/s
+    ('buttons', 'u4'), # 入力レポートのボタン3バイト (下のJOYCON_BUTTONSのビット)
+    ('stick', 'f4', (2,)), # -1.0 ~ 1.0 (横, 縦)
+    ('battery', 'u1'), # 0 ~ 8
+])
+
+# OSCパラメータ名に使うボタン名とビット位置
+JOYCON_BUTTONS = {
+    "right": (
+        ("Y", 0), ("X", 1), ("B", 2), ("A", 3), ("SR", 4), ("SL", 5), ("R", 6), ("ZR", 7),
+        ("Plus", 9), ("RStick", 10), ("Home", 12),
+    ),
+    "left": (
+        ("Minus", 8), ("LStick", 11), ("Capture", 13),
+        ("Down", 16), ("Up", 17), ("Right", 18), ("Left", 19), ("SR", 20), ("SL", 21), ("L", 22), ("ZL", 23),
+    ),
+}
+
+class SampleRing:
+    """1つのスレッドが書き込み、別の1つのスレッドがコピーせずに読む固定長のリングバッファ"""
+
+    def __init__(self, capacity=1024, dtype=JOYCON_SAMPLE_DTYPE):
+        self.capacity = capacity
+        # 同じレコードを i と i+capacity の2か所に書き、どこから読んでも1つの連続したスライスで返せるようにする
+        self.buffer = np.zeros(capacity * 2, dtype=dtype)
+        self.count = 0 # 書き込み済みのレコード数。レコードを書き終えてから進める
+        self.dropped = 0 # 読まれる前に上書きされたレコード数
+
+    def push(self, records):
+        count = self.count
+        for record in records:
+            index = count % self.capacity
+            self.buffer[index] = record
+            self.buffer[index + self.capacity] = record
+            count += 1
+        self.count = count
+
+    def read_since(self, cursor):
+        """cursor以降に書き込まれたレコードのビューと、次に渡すcursorを返す"""
+        count = self.count
+        if count - cursor > self.capacity:
+            self.dropped += count - cursor - self.capacity
+            cursor = count - self.capacity
+        start = cursor % self.capacity
+        return self.buffer[start:start + count - cursor], count
+
+    def latest(self):
+        if self.count == 0:
+            return None
+        return self.buffer[(self.count - 1) % self.capacity]
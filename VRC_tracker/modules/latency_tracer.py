@@ -0,0 +1,128 @@
+import json
+import math
+import threading
+import numpy as np
+
+# 計測する区間。FrameTraceのタイムスタンプの差から求める
+STAGES = (
+    "capture_wait",    # キャプチャ -> 推論開始
+    "inference_hands", # 各モデルの推論時間
+    "inference_face",
+    "inference_pose",
+    "processing",      # DataProcessorの処理時間
+    "send_wait",       # 処理完了 -> 出力スレッドが送信を開始するまで
+    "send",            # OSCの送信時間
+    "end_to_end",      # キャプチャ -> 送信完了
+)
+
+class FrameTrace:
+    """1フレーム分のタイムスタンプ (すべてtime.monotonic)。未到達の段階はNoneのまま"""
+    __slots__ = ("seq", "capture", "inference_start", "inference", "processing_start", "processed", "send_start", "sent")
+
+    def __init__(self, seq, capture):
+        self.seq = seq
+        self.capture = capture
+        self.inference_start = None
+        self.inference = {} # モデル名 -> (開始, 終了)
+        self.processing_start = None
+        self.processed = None
+        self.send_start = None
+        self.sent = None
+
+class LatencyHistogram:
+    """対数間隔のバケットを持つ固定サイズのヒストグラム。値は秒で記録する"""
+
+    def __init__(self, min_value=1e-5, max_value=10.0, bucket_count=96):
+        self.min_value = min_value
+        self.log_ratio = math.log(max_value / min_value) / bucket_count
+        # counts[0]はmin_value未満、counts[-1]はmax_value以上
+        self.counts = np.zeros(bucket_count + 2, dtype=np.int64)
+        self.upper_edges = np.append(min_value * np.exp(self.log_ratio * np.arange(bucket_count + 1)), np.inf)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value < self.min_value:
+            index = 0
+        else:
+            index = min(int(math.log(value / self.min_value) / self.log_ratio) + 1, len(self.counts) - 1)
+        self.counts[index] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def percentile(self, q):
+        """q% 点を含むバケットの上端を返す (バケット幅ぶん大きめの値になる)"""
+        count = self.count
+        if count == 0:
+            return None
+        index = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * count))
+        return min(float(self.upper_edges[index]), self.max)
+
+    def reset(self):
+        self.counts.fill(0)
+        self.total = 0.0
+        self.max = 0.0
+
+class LatencyTracer:
+    """FrameTraceを区間ごとのヒストグラムに集計する。トラッキングスレッドと出力スレッドの両方から呼ばれる"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {stage: LatencyHistogram() for stage in STAGES}
+        self.trace_count = 0
+
+    def record_trace(self, trace):
+        with self.lock:
+            self.trace_count += 1
+            if trace.inference_start is not None:
+                self.histograms["capture_wait"].record(trace.inference_start - trace.capture)
+            for name, (start, end) in trace.inference.items():
+                self.histograms[f"inference_{name}"].record(end - start)
+            if trace.processed is not None:
+                self.histograms["processing"].record(trace.processed - trace.processing_start)
+            if trace.sent is not None:
+                self.histograms["send_wait"].record(trace.send_start - trace.processed)
+                self.histograms["send"].record(trace.sent - trace.send_start)
+                self.histograms["end_to_end"].record(trace.sent - trace.capture)
+
+    def summary(self):
+        """区間ごとの件数とp50/p95/p99/max/mean (ミリ秒)"""
+        summary = {}
+        with self.lock:
+            for stage, histogram in self.histograms.items():
+                count = histogram.count
+                if count == 0:
+                    continue
+                summary[stage] = {
+                    "count": count,
+                    "p50": histogram.percentile(50) * 1000,
+                    "p95": histogram.percentile(95) * 1000,
+                    "p99": histogram.percentile(99) * 1000,
+                    "max": histogram.max * 1000,
+                    "mean": histogram.total / count * 1000,
+                }
+        return summary
+
+    def dump(self, path):
+        """集計結果とバケットの生データをJSONで書き出す"""
+        summary = self.summary()
+        with self.lock:
+            data = {
+                "trace_count": self.trace_count,
+                "summary_ms": summary,
+                "bucket_upper_edges_s": self.histograms[STAGES[0]].upper_edges[:-1].tolist(),
+                "counts": {stage: histogram.counts.tolist() for stage, histogram in self.histograms.items()},
+            }
+        with open(path, "w") as dump_file:
+            json.dump(data, dump_file, indent=2)
+
+    def reset(self):
+        with self.lock:
+            for histogram in self.histograms.values():
+                histogram.reset()
+            self.trace_count = 0
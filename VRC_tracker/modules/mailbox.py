@@ -0,0 +1,37 @@
+import threading
+
+class Mailbox:
+    """スレッド間で最新の値だけを受け渡す箱。キーごとに1つの値を持ち、書き込みは読まれていない値を上書きする。
+    書き手は待たされず、読み手は前回読んでから書き込まれた最新の値だけを受け取る"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = {} # キー -> (シーケンス番号, 値)。読まれるまでの値だけを持つ
+        self.seq = 0 # これまでに書き込んだ回数
+        self.read_seq = 0 # 読み手が最後に読んだ時点のシーケンス番号
+        self.dropped = {} # キー -> 読まれる前に上書きされた回数
+
+    def put(self, key, value):
+        with self.lock:
+            self.seq += 1
+            if key in self.slots:
+                self.dropped[key] = self.dropped.get(key, 0) + 1
+                del self.slots[key] # 書き込み順に並ぶように入れ直す
+            self.slots[key] = (self.seq, value)
+
+    def take(self):
+        """前回読んでから書き込まれた値を {キー: 値} で返す (書き込み順)。何も無ければ空のdict"""
+        with self.lock:
+            slots = self.slots
+            self.slots = {}
+            self.read_seq = self.seq
+        return {key: value for key, (_, value) in slots.items()}
+
+    def pending(self, key=None):
+        """まだ読まれていない値があるか (keyを指定するとそのキーだけを見る)"""
+        with self.lock:
+            return bool(self.slots) if key is None else key in self.slots
+
+    def stats(self):
+        with self.lock:
+            return {"seq": self.seq, "read_seq": self.read_seq, "dropped": dict(self.dropped)}
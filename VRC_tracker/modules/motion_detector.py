@@ -0,0 +1,86 @@
+import cv2
+import numpy as np
+
+class MotionDetector:
+    """縮小したグレースケール画像の差分から、領域ごとの動きの有無を判定する軽量な前段処理"""
+
+    def __init__(self, threshold=6.0, max_skip=0.5, idle_timeout=10.0, idle_refresh_interval=2.0,
+                 grid_size=(8, 6), scale_width=160):
+        self.threshold = threshold # セルごとの平均輝度差 (0-255) がこれを超えたら動きありとみなす
+        self.max_skip = max_skip # 動きが無くてもこの秒数ごとには推論し直す
+        self.idle_timeout = idle_timeout # 画面全体に動きが無い状態がこの秒数続いたらアイドルモード
+        self.idle_refresh_interval = idle_refresh_interval # アイドルモード中の推論間隔
+        self.grid_cols, self.grid_rows = grid_size
+        self.scale_width = scale_width
+
+        self.reference = None # 画面全体で最後に動きを検出した時点の縮小グレースケール画像 (アイドル判定用)
+        self.activity = None # (grid_rows, grid_cols) セルごとの平均差分 (アイドル判定用)
+        self.last_motion_time = None
+        self.gray = None # 最新フレームの縮小グレースケール画像
+        # モデル名 -> そのモデルが最後に推論したフレームの縮小グレースケール画像。
+        # 基準画像をモデルごとに持つので、別の領域の動きや推論しなかったフレームの動きで基準がリセットされない
+        self.model_references = {}
+
+    def update(self, frame, now):
+        height, width = frame.shape[:2]
+        scale_height = max(1, int(height * self.scale_width / width))
+        small = cv2.resize(frame, (self.scale_width, scale_height), interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        self.gray = gray
+
+        if self.reference is None or self.reference.shape != gray.shape:
+            self.reference = gray
+            self.model_references = {}
+            self.activity = np.full((self.grid_rows, self.grid_cols), np.inf, dtype=np.float32)
+            self.last_motion_time = now
+            return
+
+        # 連続フレーム間ではなく基準画像との差分を取ることで、ゆっくりした動きも積み上がって検出される
+        self.activity = self._activity(self.reference)
+        if (self.activity > self.threshold).any():
+            self.reference = gray
+            self.last_motion_time = now
+
+    def _activity(self, reference):
+        diff = cv2.absdiff(self.gray, reference)
+        # INTER_AREAでグリッドサイズに縮小するとセルごとの平均値になる
+        return cv2.resize(diff, (self.grid_cols, self.grid_rows), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+    def mark_inferred(self, name):
+        """モデルが最新フレームで推論したので、そのモデルの基準画像を更新する"""
+        if self.gray is not None:
+            self.model_references[name] = self.gray
+
+    def has_motion(self, region=None, name=None):
+        """region: 正規化座標の(x_min, y_min, x_max, y_max)。Noneなら画面全体。
+        nameを指定すると、そのモデルが最後に推論したフレームからの動きで判定する"""
+        if self.activity is None:
+            return True
+        activity = self.activity
+        if name is not None:
+            reference = self.model_references.get(name)
+            if reference is None:
+                return True
+            activity = self._activity(reference)
+        if region is None:
+            return bool((activity > self.threshold).any())
+
+        x_min, y_min, x_max, y_max = region
+        # 領域の周囲1セルも含めて判定する (領域外から入ってくる動きを拾うため)
+        col_start = max(0, int(x_min * self.grid_cols) - 1)
+        col_end = min(self.grid_cols, int(x_max * self.grid_cols) + 2)
+        row_start = max(0, int(y_min * self.grid_rows) - 1)
+        row_end = min(self.grid_rows, int(y_max * self.grid_rows) + 2)
+        if col_start >= col_end or row_start >= row_end:
+            return bool((activity > self.threshold).any())
+        return bool((activity[row_start:row_end, col_start:col_end] > self.threshold).any())
+
+    def is_idle(self, now):
+        return self.last_motion_time is not None and now - self.last_motion_time >= self.idle_timeout
+
+    def allows_skip(self, name, region, last_inference_time, now):
+        """モデルが最後に推論してからregionに動きが無く、最後の推論から許容時間内なら推論を省略してよい"""
+        max_skip = self.idle_refresh_interval if self.is_idle(now) else self.max_skip
+        if last_inference_time is None or now - last_inference_time >= max_skip:
+            return False
+        return not self.has_motion(region, name)
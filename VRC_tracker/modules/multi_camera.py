@@ -0,0 +1,154 @@
+import multiprocessing
+import time
+from types import SimpleNamespace
+import numpy as np
+
+from modules.inference_worker import RemoteCameraTracker
+
+STALE_TIMEOUT = 0.5 # これより古い結果しか無いカメラ (止まった・外れた) はまとめる対象から外す (秒)
+SWITCH_MARGIN = 0.05 # 前回選んだカメラから切り替えるのに必要な確信度/可視性スコアの差 (ちらつき防止)
+
+def _mean_visibility(landmark_list):
+    points = getattr(landmark_list, "points", None)
+    if points is not None:
+        return float(points[:, 3].mean())
+    return float(np.mean([lm.visibility for lm in landmark_list.landmark]))
+
+def _choose(candidates, previous):
+    """(スコア, カメラ番号, 値) の候補から1つ選ぶ。前回のカメラはSWITCH_MARGINだけ有利にする"""
+    return max(candidates, key=lambda candidate: candidate[0] + (SWITCH_MARGIN if candidate[1] == previous else 0.0))
+
+class MultiCameraTracker:
+    """複数のカメラをそれぞれの推論ワーカー (別プロセス) で動かし、各カメラの最新の結果を1つの結果にまとめる。
+    手は左右ごとに左右判定の確信度が最も高いカメラ、ポーズは可視性スコアの平均が最も高いカメラ、顔は設定順で最初に検出したカメラの結果を使う。
+    カメラ間の位置合わせはしないので、ランドマークは点ごとではなく手・顔・ポーズの単位で選ぶ"""
+
+    def __init__(self, device_ids, camera_probes, cpu_affinity=None, **tracker_kwargs):
+        context = multiprocessing.get_context("spawn")
+        self.frame_ready = context.Event() # どれかのワーカーがフレームを書き込んだらセットされる
+        self.trackers = []
+        for index, (device_id, camera_probe) in enumerate(zip(device_ids, camera_probes)):
+            # CPUを固定する場合は、指定されたCPUをカメラごとに分けて使う (足りなければ共有する)
+            cpus = None
+            if cpu_affinity:
+                cpus = cpu_affinity[index::len(device_ids)] or cpu_affinity
+            self.trackers.append(RemoteCameraTracker(cpu_affinity=cpus, frame_ready=self.frame_ready, device_id=device_id,
+                                                     camera_probe=camera_probe, **tracker_kwargs))
+
+        self.frame_timestamp = 0.0
+        self.trace = None
+        self.updated_models = set()
+        self.frame = None # プレビューに使う最初のカメラの最新フレーム
+        # カメラごとの最新の結果 (hand_results, face_results, pose_results, キャプチャ時刻)
+        self.latest = [None] * len(self.trackers)
+        self.chosen = {} # 手の左右/顔/ポーズ -> 前回選んだカメラ番号
+        # カメラごと・モデルごとに推論し直した回数。まとめた結果が変わったかどうかの判定に使う
+        self.versions = [dict.fromkeys(("hands", "face", "pose"), 0) for _ in self.trackers]
+        self.sources = {} # モデル名 -> 前回まとめた時の候補 (選んだカメラと各候補のカメラ番号・推論回数)
+
+    @property
+    def cap(self):
+        # 最初のカメラを開けているか (TrackingThreadはこれを見て最初のカメラを開き直す)
+        return self.trackers[0].cap
+
+    def open_camera(self, device_id, camera_probe=None):
+        return self.trackers[0].open_camera(device_id, camera_probe)
+
+    def set_capture_format(self, capture_format):
+        # 最初のカメラはTrackingThreadがopen_cameraで開き直すので、追加のカメラだけをここで開き直す
+        for index, tracker in enumerate(self.trackers):
+            tracker.set_capture_format(capture_format)
+            if index > 0:
+                tracker.reopen_camera()
+
+    def set_inference_widths(self, inference_widths):
+        for tracker in self.trackers:
+            tracker.set_inference_widths(inference_widths)
+
+    def set_pose_confidence(self, min_detection_confidence, min_tracking_confidence):
+        for tracker in self.trackers:
+            tracker.set_pose_confidence(min_detection_confidence, min_tracking_confidence)
+
+    def set_parallel_inference(self, enabled):
+        for tracker in self.trackers:
+            tracker.set_parallel_inference(enabled)
+
+    def set_inference_rates(self, rates):
+        for tracker in self.trackers:
+            tracker.set_inference_rates(rates)
+
+    def set_motion_detector(self, motion_detector):
+        # MotionDetectorはワーカーごとにコピーされるので、カメラごとに別の状態を持つ
+        for tracker in self.trackers:
+            tracker.set_motion_detector(motion_detector)
+
+    def get_landmarks(self):
+        if self.frame_ready.wait(1.0):
+            self.frame_ready.clear()
+
+        trace = None
+        for index, tracker in enumerate(self.trackers):
+            hand_results, face_results, pose_results, frame = tracker.read_latest()
+            if frame is None:
+                continue
+            self.latest[index] = (hand_results, face_results, pose_results, tracker.frame_timestamp)
+            for name in tracker.updated_models:
+                self.versions[index][name] += 1
+            if index == 0:
+                self.frame = frame
+            # レイテンシは最も新しいフレームで計測する
+            if trace is None or tracker.frame_timestamp > trace.capture:
+                trace = tracker.trace
+        if trace is None or self.frame is None:
+            return None, None, None, None
+
+        self.frame_timestamp = trace.capture
+        self.trace = trace
+        hand_results, face_results, pose_results = self._fuse(time.monotonic())
+        return hand_results, face_results, pose_results, self.frame
+
+    def _select(self, key, candidates, model_name, sources):
+        """候補から1つ選ぶ。選んだカメラと候補のカメラ・推論回数をsourcesに記録する"""
+        _, index, value = _choose(candidates, self.chosen.get(key))
+        self.chosen[key] = index
+        sources[model_name].append((key, index, tuple((i, self.versions[i][model_name]) for _, i, _ in candidates)))
+        return value
+
+    def _fuse(self, now):
+        # 候補の集まり (カメラで見失った・古くなった場合を含む)・選んだカメラ・候補の推論結果のどれかが変わったモデルを更新ありとする
+        # (どのカメラでも推論し直さず候補も変わらなければ、まとめた結果は前回と同じなので処理し直さない)
+        sources = {"hands": [], "face": [], "pose": []}
+        hand_candidates = {}
+        face_results = None
+        pose_candidates = []
+        for index, latest in enumerate(self.latest):
+            if latest is None or now - latest[3] > STALE_TIMEOUT:
+                continue
+            hand_results, camera_face_results, pose_results, _ = latest
+            if hand_results.multi_hand_landmarks:
+                for landmarks, handedness in zip(hand_results.multi_hand_landmarks, hand_results.multi_handedness):
+                    classification = handedness.classification[0]
+                    hand_candidates.setdefault(classification.label, []).append((classification.score, index, (landmarks, handedness)))
+            if face_results is None and camera_face_results.multi_face_landmarks:
+                face_results = self._select("face", [(0.0, index, camera_face_results)], "face", sources)
+            if pose_results.pose_landmarks:
+                pose_candidates.append((_mean_visibility(pose_results.pose_landmarks), index, pose_results))
+
+        fused_hands = SimpleNamespace(multi_hand_landmarks=None, multi_handedness=None)
+        for label, candidates in sorted(hand_candidates.items()):
+            landmarks, handedness = self._select(label, candidates, "hands", sources)
+            fused_hands.multi_hand_landmarks = (fused_hands.multi_hand_landmarks or []) + [landmarks]
+            fused_hands.multi_handedness = (fused_hands.multi_handedness or []) + [handedness]
+
+        fused_pose = SimpleNamespace(pose_landmarks=None)
+        if pose_candidates:
+            fused_pose = self._select("pose", pose_candidates, "pose", sources)
+
+        self.updated_models = {name for name, source in sources.items() if source != self.sources.get(name)}
+        self.sources = sources
+
+        return fused_hands, face_results or SimpleNamespace(multi_face_landmarks=None), fused_pose
+
+    def release(self):
+        for tracker in self.trackers:
+            tracker.release()
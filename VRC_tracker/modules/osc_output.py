@@ -0,0 +1,86 @@
+import threading
+import time
+
+class OSCOutputThread(threading.Thread):
+    """最新のパラメータ状態を一定レートで送信する出力スレッド。カメラやJoy-Conからの更新は状態に書き込むだけ"""
+
+    def __init__(self, osc_sender, rate=60.0, tracer=None, output_filter=None):
+        super().__init__(daemon=True)
+        self.osc_sender = osc_sender
+        self.tracer = tracer # 指定されていれば、送信したフレームのFrameTraceを集計する
+        self.output_filter = output_filter # 指定されていれば、送信時刻まで外挿した値を送る (OutputFilterBank)
+        self.interval = 1.0 / rate
+        self.running = True
+
+        self.lock = threading.Lock()
+        self.state = {} # アドレス -> 最新の値
+        self.sources = [] # 毎tick呼び出してパラメータを取得する関数 (Joy-Conなど)
+        self.pending_trace = None # 状態に書き込まれたがまだ送信していないフレームのトレース
+
+    def set_rate(self, rate):
+        self.interval = 1.0 / rate
+
+    def add_source(self, source):
+        self.sources.append(source)
+
+    def update(self, params, trace=None):
+        superseded_trace = None
+        with self.lock:
+            self.state.update(params)
+            if trace is not None:
+                superseded_trace = self.pending_trace
+                self.pending_trace = trace
+        # 送信前に次のフレームで上書きされたトレースは、送信以外の区間だけ集計する
+        if superseded_trace is not None and self.tracer:
+            self.tracer.record_trace(superseded_trace)
+
+    def publish(self):
+        """1tick分の処理。ソースを読み、状態のうち変化した分を送信する"""
+        for source in self.sources:
+            try:
+                params = source()
+                if params:
+                    self.update(params)
+            except Exception as e:
+                print(f"OSC output source error: {e}")
+
+        with self.lock:
+            params = dict(self.state)
+            trace = self.pending_trace
+            self.pending_trace = None
+
+        output_filter = self.output_filter
+        if output_filter and params:
+            params = output_filter.apply(params, time.monotonic())
+
+        sent = {}
+        if params:
+            send_start = time.monotonic()
+            try:
+                sent = self.osc_sender.send_changes(params)
+            except Exception as e:
+                print(f"OSC output error: {e}")
+            if trace is not None:
+                trace.send_start = send_start
+                trace.sent = time.monotonic()
+        if trace is not None and self.tracer:
+            self.tracer.record_trace(trace)
+        return sent
+
+    def run(self):
+        print("OSC output thread started.")
+        next_time = time.monotonic()
+        while self.running:
+            self.publish()
+
+            # 送信間隔がぶれないように、前回の予定時刻を基準に次の送信時刻を決める
+            next_time += self.interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif delay < -self.interval:
+                # 大きく遅れた場合は追いつこうとせずに基準をリセットする
+                next_time = time.monotonic()
+
+    def stop(self):
+        self.running = False
@@ -1,8 +1,100 @@
-from pythonosc import udp_client
+import time
+from pythonosc import udp_client, osc_bundle_builder, osc_message_builder
 
 class OSCSender:
-    def __init__(self, host, port):
+    # 1バンドルの最大サイズ (IPフラグメントが起きないようにイーサネットのMTUより小さくする)
+    MAX_BUNDLE_SIZE = 1400
+    BUNDLE_HEADER_SIZE = 16 # "#bundle\0" + タイムタグ
+
+    def __init__(self, host, port, quantization_step=0.0, deadband=0.0, deadbands=None, keepalive_interval=1.0):
         self.client = udp_client.SimpleUDPClient(host, port)
 
+        # 送信側の状態キャッシュ (アドレス -> 最後に送った値 / 時刻)
+        self.sent_values = {}
+        self.sent_times = {}
+        self.configure(quantization_step, deadband, deadbands, keepalive_interval)
+
+    def configure(self, quantization_step=0.0, deadband=0.0, deadbands=None, keepalive_interval=1.0):
+        self.quantization_step = quantization_step # floatをこの刻みに丸めてから比較する (0で丸めない)
+        self.default_deadband = deadband
+        # パラメータごとのデッドバンド。キーはアドレス全体かパラメータ名 (大文字小文字は区別しない)
+        self.deadbands = {key.lower(): value for key, value in (deadbands or {}).items()}
+        self._deadband_cache = {}
+        self.keepalive_interval = keepalive_interval # 変化が無くてもこの秒数ごとに再送する (パケットロス対策)
+
+    def _get_deadband(self, address):
+        deadband = self._deadband_cache.get(address)
+        if deadband is None:
+            key = address.lower()
+            deadband = self.deadbands.get(key, self.deadbands.get(key.rsplit('/', 1)[-1], self.default_deadband))
+            self._deadband_cache[address] = deadband
+        return deadband
+
+    def set_target(self, host, port):
+        # UDPClientは送信先を後から変えられないので作り直す。新しい送信先には全パラメータを送り直す
+        self.client = udp_client.SimpleUDPClient(host, port)
+        self.reset()
+
     def send(self, address, value):
         self.client.send_message(address, value)
+
+    def send_bundle(self, params):
+        """1tick分のパラメータを同じタイムタグのOSCバンドルにまとめて送る。MTUを超える分は別のバンドルに分ける"""
+        bundle_builder = None
+        bundle_size = 0
+        for address, value in params.items():
+            message_builder = osc_message_builder.OscMessageBuilder(address=address)
+            message_builder.add_arg(value)
+            message = message_builder.build()
+            element_size = 4 + message.size # 要素ごとにサイズ(int32)が前に付く
+
+            if bundle_builder is not None and bundle_size + element_size > self.MAX_BUNDLE_SIZE:
+                self.client.send(bundle_builder.build())
+                bundle_builder = None
+            if bundle_builder is None:
+                bundle_builder = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+                bundle_size = self.BUNDLE_HEADER_SIZE
+            bundle_builder.add_content(message)
+            bundle_size += element_size
+
+        if bundle_builder is not None:
+            self.client.send(bundle_builder.build())
+
+    def send_changes(self, params, now=None):
+        """前回送った値から変化したパラメータだけを送る。変化が無くてもkeepalive_interval秒ごとに再送する"""
+        if now is None:
+            now = time.monotonic()
+
+        changed = {}
+        for address, value in params.items():
+            last_value = self.sent_values.get(address)
+            if isinstance(value, float):
+                if self.quantization_step > 0:
+                    value = round(value / self.quantization_step) * self.quantization_step
+                deadband = self._get_deadband(address)
+                if not isinstance(last_value, float):
+                    is_changed = True
+                elif self.quantization_step > 0:
+                    # 丸めた値は刻みの数で比較する。deadbandも刻みの数に丸め、1刻みの変化は必ず送る
+                    # (deadbandが1刻みよりわずかに大きいだけで、1刻みの変化がkeepaliveまで送られなくなるのを防ぐ)
+                    steps = round(abs(value - last_value) / self.quantization_step)
+                    is_changed = steps >= max(1, round(deadband / self.quantization_step))
+                else:
+                    is_changed = abs(value - last_value) > deadband
+            else:
+                # bool/intは値が変わった時だけ送る
+                is_changed = last_value is None or last_value != value
+
+            if is_changed or now - self.sent_times.get(address, 0.0) >= self.keepalive_interval:
+                changed[address] = value
+                self.sent_values[address] = value
+                self.sent_times[address] = now
+
+        if changed:
+            self.send_bundle(changed)
+        return changed
+
+    def reset(self):
+        # 送信先が変わった時などに、次回すべてのパラメータを送り直す
+        self.sent_values.clear()
+        self.sent_times.clear()
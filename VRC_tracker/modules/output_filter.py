@@ -0,0 +1,108 @@
+import math
+import threading
+import numpy as np
+
+class OutputFilterBank:
+    """floatのOSCパラメータごとのOne Euroフィルタ。全パラメータを配列で持ってまとめて計算する。
+    推論結果をキャプチャ時刻付きで受け取り (observe)、送信時に送信時刻まで外挿した値に置き換える (apply)"""
+
+    def __init__(self, min_cutoff=1.0, beta=5.0, d_cutoff=1.0, max_prediction=0.1, capacity=64):
+        self.configure(min_cutoff, beta, d_cutoff, max_prediction)
+        self.lock = threading.Lock() # observeはトラッキングスレッド、applyは出力スレッドから呼ばれる
+        self.slots = {} # アドレス -> 配列のインデックス
+        self.addresses = []
+        self._allocate(capacity)
+
+    def configure(self, min_cutoff=1.0, beta=5.0, d_cutoff=1.0, max_prediction=0.1):
+        self.min_cutoff = min_cutoff # 静止時のカットオフ周波数 (Hz)。小さいほど滑らかになるが遅れる
+        self.beta = beta # 速度に応じてカットオフを上げる係数。大きいほど速い動きに追従する
+        self.d_cutoff = d_cutoff # 速度の推定に使うカットオフ周波数 (Hz)
+        self.max_prediction = max_prediction # 外挿する最大の時間 (秒)。0で外挿しない
+
+    def _allocate(self, capacity):
+        old_count = len(self.addresses)
+        arrays = {
+            "value": np.zeros(capacity), # フィルタ後の値
+            "velocity": np.zeros(capacity), # フィルタ後の速度 (1秒あたり)
+            "time": np.zeros(capacity), # 最後に観測したキャプチャ時刻
+            "low": np.zeros(capacity), # 観測した値の範囲。外挿した値がこの範囲を超えないようにする
+            "high": np.zeros(capacity),
+        }
+        for name, array in arrays.items():
+            if old_count:
+                array[:old_count] = getattr(self, name)[:old_count]
+            setattr(self, name, array)
+
+    def reset(self):
+        with self.lock:
+            self.slots = {}
+            self.addresses = []
+
+    def _smoothing(self, dt, cutoff):
+        tau = 1.0 / (2.0 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def observe(self, params, timestamp):
+        """新しく推論した結果を観測値として入れる。float以外 (boolやジェスチャー番号) は無視する"""
+        with self.lock:
+            indices = []
+            values = []
+            new_indices = []
+            for address, value in params.items():
+                if type(value) is not float:
+                    continue
+                index = self.slots.get(address)
+                if index is None:
+                    index = len(self.addresses)
+                    if index >= len(self.value):
+                        self._allocate(len(self.value) * 2)
+                    self.slots[address] = index
+                    self.addresses.append(address)
+                    new_indices.append(index)
+                indices.append(index)
+                values.append(value)
+            if not indices:
+                return
+
+            indices = np.array(indices)
+            measured = np.array(values)
+            if new_indices:
+                # 初めて観測したパラメータは観測値をそのまま使う
+                new_indices = np.array(new_indices)
+                self.value[new_indices] = self.low[new_indices] = self.high[new_indices] = np.nan
+                self.velocity[new_indices] = 0.0
+                self.time[new_indices] = timestamp
+
+            previous = self.value[indices]
+            dt = timestamp - self.time[indices]
+            first = np.isnan(previous)
+            # 同じフレームの結果をもう一度受け取った場合 (dt <= 0) は平滑化せず値だけ置き換える
+            update = (dt > 0) & ~first
+            safe_dt = np.where(update, dt, 1.0)
+
+            raw_velocity = (measured - np.where(first, measured, previous)) / safe_dt
+            velocity = self.velocity[indices]
+            velocity = np.where(update, velocity + self._smoothing(safe_dt, self.d_cutoff) * (raw_velocity - velocity), velocity)
+            cutoff = self.min_cutoff + self.beta * np.abs(velocity)
+            smoothed = previous + self._smoothing(safe_dt, cutoff) * (measured - previous)
+
+            self.value[indices] = np.where(update, smoothed, measured)
+            self.velocity[indices] = velocity
+            self.time[indices] = np.maximum(self.time[indices], timestamp)
+            self.low[indices] = np.fmin(self.low[indices], measured)
+            self.high[indices] = np.fmax(self.high[indices], measured)
+
+    def apply(self, params, now):
+        """paramsのうちフィルタしているパラメータを、nowまで外挿した値に置き換えたdictを返す"""
+        with self.lock:
+            count = len(self.addresses)
+            if not count:
+                return params
+            lead = np.clip(now - self.time[:count], 0.0, self.max_prediction)
+            predicted = np.clip(self.value[:count] + self.velocity[:count] * lead, self.low[:count], self.high[:count])
+            addresses = self.addresses
+        params = dict(params)
+        for address, value in zip(addresses, predicted.tolist()):
+            if address in params:
+                params[address] = value
+        return params
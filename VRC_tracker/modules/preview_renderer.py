@@ -0,0 +1,49 @@
+import cv2
+import mediapipe as mp
+
+class PreviewRenderer:
+    """GUIプレビュー用に縮小したフレームのコピーへ検出結果を描画し、GUIがそのまま表示できるRGBで返す (OSC出力には影響しない)"""
+
+    def __init__(self, width=640, height=480):
+        self.size = (width, height)
+
+        self.mp_drawing = mp.solutions.drawing_utils
+        self.mp_hands = mp.solutions.hands
+        self.mp_face_mesh = mp.solutions.face_mesh
+        self.mp_pose = mp.solutions.pose
+
+        # DrawingSpecは毎回作らずに使い回す
+        self.tesselation_spec = self.mp_drawing.DrawingSpec(color=(0,255,0), thickness=1, circle_radius=1)
+        self.contour_spec = self.mp_drawing.DrawingSpec(color=(255,0,0), thickness=2, circle_radius=2)
+
+    def render(self, frame, hand_results, face_results, pose_results):
+        # 元のフレームは書き換えず、縮小したコピーに描画する (プレビューなので画質より速さを優先する)
+        preview = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+
+        if hand_results and hand_results.multi_hand_landmarks:
+            for hand_landmarks in hand_results.multi_hand_landmarks:
+                self.mp_drawing.draw_landmarks(
+                    preview, hand_landmarks, self.mp_hands.HAND_CONNECTIONS)
+        if face_results and face_results.multi_face_landmarks:
+            for face_landmarks in face_results.multi_face_landmarks:
+                self.mp_drawing.draw_landmarks(
+                    image=preview,
+                    landmark_list=face_landmarks,
+                    connections=self.mp_face_mesh.FACEMESH_TESSELATION,
+                    landmark_drawing_spec=self.tesselation_spec,
+                    connection_drawing_spec=self.tesselation_spec
+                )
+                self.mp_drawing.draw_landmarks(
+                    image=preview,
+                    landmark_list=face_landmarks,
+                    connections=self.mp_face_mesh.FACEMESH_CONTOURS,
+                    landmark_drawing_spec=self.contour_spec,
+                    connection_drawing_spec=self.contour_spec
+                )
+        # ポーズのランドマークを描画
+        if pose_results and pose_results.pose_landmarks:
+            self.mp_drawing.draw_landmarks(
+                preview, pose_results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+
+        # 描画色はBGRで指定しているので、描画し終えてからRGBに変換する (GUIスレッドでは変換しない)
+        return cv2.cvtColor(preview, cv2.COLOR_BGR2RGB, dst=preview)
@@ -0,0 +1,142 @@
+import json
+import os
+import threading
+import numpy as np
+
+from modules.joycon_ring import JOYCON_SAMPLE_DTYPE
+
+# カメラ1フレーム分の固定長レコード。frames.binにそのまま追記し、再生時はnp.memmapで読む
+FRAME_DTYPE = np.dtype([
+    ('timestamp', 'f8'), # キャプチャ時刻 (time.monotonic)
+    ('updated', 'u1'), # このフレームで推論し直したモデル (bit0: hands, bit1: face, bit2: pose)
+    ('hand_count', 'u1'),
+    ('handedness', 'u1', (2,)), # 0: Left, 1: Right
+    ('hands', 'f4', (2, 21, 3)),
+    ('face_present', '?'),
+    ('face', 'f4', (478, 3)),
+    ('pose_present', '?'),
+    ('pose', 'f4', (33, 4)), # x, y, z, visibility
+])
+# Joy-ConのIMUサンプル1つ分。joycon.binに追記する
+JOYCON_RECORD_DTYPE = np.dtype([('side', 'u1')] + JOYCON_SAMPLE_DTYPE.descr) # 0: left, 1: right
+MODEL_BITS = {"hands": 1, "face": 2, "pose": 4}
+HANDEDNESS_LABELS = ("Left", "Right")
+JOYCON_SIDES = ("left", "right")
+FORMAT_VERSION = 2 # 2: Joy-ConをJSONの状態ではなくIMUサンプルで記録する
+
+def _fill_points(dest, landmark_list, with_visibility=False):
+    # 推論ワーカーから受け取ったランドマークは配列を持っているので、そのままコピーする
+    points = getattr(landmark_list, "points", None)
+    if points is not None:
+        dest[:len(points)] = points[:, :dest.shape[1]]
+        return
+    if with_visibility:
+        points = [(lm.x, lm.y, lm.z, lm.visibility) for lm in landmark_list.landmark]
+    else:
+        points = [(lm.x, lm.y, lm.z) for lm in landmark_list.landmark]
+    dest[:len(points)] = points
+
+def fill_frame_record(record, timestamp, hand_results, face_results, pose_results, updated_models=()):
+    """MediaPipeの推論結果を長さ1のFRAME_DTYPEの配列に書き込む (記録と推論ワーカーで共用する)"""
+    record.fill(0)
+    record['timestamp'] = timestamp
+    record['updated'] = sum(MODEL_BITS[name] for name in updated_models)
+
+    if hand_results and hand_results.multi_hand_landmarks:
+        hands = hand_results.multi_hand_landmarks[:2]
+        record['hand_count'] = len(hands)
+        for hand_idx, hand_landmarks in enumerate(hands):
+            label = hand_results.multi_handedness[hand_idx].classification[0].label
+            record['handedness'][0, hand_idx] = HANDEDNESS_LABELS.index(label) if label in HANDEDNESS_LABELS else 1
+            _fill_points(record['hands'][0, hand_idx], hand_landmarks)
+
+    if face_results and face_results.multi_face_landmarks:
+        record['face_present'] = True
+        _fill_points(record['face'][0], face_results.multi_face_landmarks[0])
+
+    if pose_results and pose_results.pose_landmarks:
+        record['pose_present'] = True
+        _fill_points(record['pose'][0], pose_results.pose_landmarks, with_visibility=True)
+
+class SessionRecorder:
+    """トラッキングセッション (ランドマークとJoy-Conの状態) をタイムスタンプ付きで記録する"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w") as meta_file:
+            json.dump({"version": FORMAT_VERSION, "frame_dtype": str(FRAME_DTYPE.descr), "joycon_dtype": str(JOYCON_RECORD_DTYPE.descr)}, meta_file)
+
+        self.frame_file = open(os.path.join(path, "frames.bin"), "wb")
+        self.joycon_file = open(os.path.join(path, "joycon.bin"), "wb")
+        self.frame_lock = threading.Lock()
+        self.joycon_lock = threading.Lock()
+        self.record = np.zeros(1, dtype=FRAME_DTYPE) # 毎回確保せずに使い回す
+        self.frame_count = 0
+        print(f"Recording session to {path}")
+
+    def record_frame(self, timestamp, hand_results, face_results, pose_results, updated_models=()):
+        with self.frame_lock:
+            if self.frame_file is None:
+                return
+            fill_frame_record(self.record, timestamp, hand_results, face_results, pose_results, updated_models)
+            self.frame_file.write(self.record.tobytes())
+            self.frame_count += 1
+
+    def record_joycon(self, joycon_samples):
+        """JoyConManager.read_new_samplesが返したサンプルをそのまま記録する (時刻はサンプルごとに持っている)"""
+        with self.joycon_lock:
+            if self.joycon_file is None:
+                return
+            for side, samples in joycon_samples.items():
+                if not len(samples):
+                    continue
+                records = np.empty(len(samples), dtype=JOYCON_RECORD_DTYPE)
+                records['side'] = JOYCON_SIDES.index(side)
+                for name in JOYCON_SAMPLE_DTYPE.names:
+                    records[name] = samples[name]
+                self.joycon_file.write(records.tobytes())
+
+    def close(self):
+        with self.frame_lock:
+            if self.frame_file:
+                self.frame_file.close()
+                self.frame_file = None
+        with self.joycon_lock:
+            if self.joycon_file:
+                self.joycon_file.close()
+                self.joycon_file = None
+        print(f"Recording finished: {self.frame_count} frames written to {self.path}")
+
+class SessionReader:
+    """SessionRecorderで記録したセッションを読み込む。フレームはメモリマップで参照する"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as meta_file:
+            meta = json.load(meta_file)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported session format version: {meta.get('version')}")
+
+        self.frames = self._load_records(os.path.join(path, "frames.bin"), FRAME_DTYPE)
+        self.joycon_samples = self._load_records(os.path.join(path, "joycon.bin"), JOYCON_RECORD_DTYPE)
+
+    def _load_records(self, record_path, dtype):
+        if os.path.exists(record_path) and os.path.getsize(record_path) >= dtype.itemsize:
+            return np.memmap(record_path, dtype=dtype, mode="r")
+        return np.zeros(0, dtype=dtype)
+
+    def events(self):
+        """("frame", timestamp, record) と ("joycon", timestamp, {side: サンプル1つの配列}) を時刻順に返す"""
+        frame_idx = 0
+        joycon_idx = 0
+        while frame_idx < len(self.frames) or joycon_idx < len(self.joycon_samples):
+            frame_time = float(self.frames[frame_idx]['timestamp']) if frame_idx < len(self.frames) else float("inf")
+            joycon_time = float(self.joycon_samples[joycon_idx]['timestamp']) if joycon_idx < len(self.joycon_samples) else float("inf")
+            if frame_time <= joycon_time:
+                yield "frame", frame_time, self.frames[frame_idx]
+                frame_idx += 1
+            else:
+                sample = self.joycon_samples[joycon_idx:joycon_idx + 1]
+                yield "joycon", joycon_time, {JOYCON_SIDES[int(sample['side'][0])]: sample}
+                joycon_idx += 1
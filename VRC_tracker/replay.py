@@ -0,0 +1,105 @@
+import argparse
+import time
+
+from config import ConfigManager
+from modules.data_processor import DataProcessor
+from modules.osc_sender import OSCSender
+from modules.output_filter import OutputFilterBank
+from modules.session_recorder import SessionReader, HANDEDNESS_LABELS, MODEL_BITS
+
+def process_frame_record(data_processor, record, outputs, output_filter=None):
+    """記録した1フレームをDataProcessorに通す。推論し直していないモデルは前回の出力を使い回す (TrackingThreadと同じ)"""
+    updated = int(record['updated'])
+    refreshed = []
+
+    if updated & MODEL_BITS["hands"] or "hands" not in outputs:
+        hand_count = int(record['hand_count'])
+        handedness = [HANDEDNESS_LABELS[i] for i in record['handedness'][:hand_count]]
+        outputs["hands"] = data_processor.process_hand_arrays(record['hands'][:hand_count], handedness)
+        refreshed.append("hands")
+    if updated & MODEL_BITS["face"] or "face" not in outputs:
+        outputs["face"] = data_processor.process_face_arrays(record['face']) if record['face_present'] else ({}, {}, {})
+        refreshed.append("face")
+    if updated & MODEL_BITS["pose"] or "pose" not in outputs:
+        outputs["pose"] = data_processor.process_pose_arrays(record['pose']) if record['pose_present'] else ({}, {}, {})
+        refreshed.append("pose")
+
+    if output_filter:
+        for name in refreshed:
+            output_filter.observe(outputs[name][0], float(record['timestamp']))
+
+    osc_params = {}
+    for osc, _, _ in outputs.values():
+        osc_params.update(osc)
+    return osc_params
+
+def replay_session(reader, data_processor, osc_sender=None, realtime=False, output_filter=None):
+    outputs = {}
+    frame_count = 0
+    joycon_count = 0
+    process_times = []
+
+    first_timestamp = None
+    start_time = time.monotonic()
+    for kind, timestamp, data in reader.events():
+        if first_timestamp is None:
+            first_timestamp = timestamp
+        if realtime:
+            # 記録時と同じ間隔で再生する
+            delay = (timestamp - first_timestamp) - (time.monotonic() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+
+        process_start = time.perf_counter()
+        if kind == "frame":
+            osc_params = process_frame_record(data_processor, data, outputs, output_filter)
+            frame_count += 1
+        else:
+            osc_params, _, _ = data_processor.process_joycon_data(data)
+            joycon_count += 1
+        process_times.append(time.perf_counter() - process_start)
+
+        if osc_sender and osc_params:
+            if output_filter:
+                osc_params = output_filter.apply(osc_params, timestamp)
+            osc_sender.send_changes(osc_params, now=timestamp)
+
+    elapsed = time.monotonic() - start_time
+    print(f"Replayed {frame_count} frames and {joycon_count} Joy-Con samples in {elapsed:.2f}s")
+    if process_times:
+        process_times.sort()
+        mean_us = sum(process_times) / len(process_times) * 1e6
+        print(f"Processing time per event: mean {mean_us:.1f}us, max {process_times[-1] * 1e6:.1f}us")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded tracking session through DataProcessor and OSCSender.")
+    parser.add_argument("session", help="Directory written by main.py --record")
+    parser.add_argument("--settings", default="VRC_tracker/settings.ini")
+    parser.add_argument("--realtime", action="store_true", help="Replay with the recorded timing instead of as fast as possible")
+    parser.add_argument("--no-osc", action="store_true", help="Process only, do not send OSC")
+    parser.add_argument("--no-filter", action="store_true", help="Send raw values without the output filter")
+    parser.add_argument("--host", help="Override the OSC host from the settings")
+    parser.add_argument("--port", type=int, help="Override the OSC port from the settings")
+    args = parser.parse_args()
+
+    config = ConfigManager(args.settings)
+    data_processor = DataProcessor(config)
+    osc_sender = None
+    if not args.no_osc:
+        osc_sender = OSCSender(
+            args.host or config.get_osc_host(),
+            args.port or config.get_osc_port(),
+            quantization_step=config.get_osc_quantization_step(),
+            deadband=config.get_osc_deadband(),
+            deadbands=config.get_osc_deadbands(),
+            keepalive_interval=config.get_osc_keepalive_interval()
+        )
+
+    output_filter = None
+    if not args.no_filter and config.get_output_filter_enabled():
+        output_filter = OutputFilterBank(**config.get_output_filter_parameters())
+
+    replay_session(SessionReader(args.session), data_processor, osc_sender, realtime=args.realtime, output_filter=output_filter)
+
+if __name__ == "__main__":
+    main()
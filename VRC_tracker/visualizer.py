@@ -1,180 +1,220 @@
 import pyglet
 import pyglet.gl as gl
-import queue
+from pyglet.math import Mat4, Vec3
 import threading
-import math
-import mediapipe as mp # MediaPipeをインポート
+import numpy as np
+from modules.landmark_indices import POSE_CONNECTIONS
+
+HAND_CONNECTIONS = (
+    (0, 1), (1, 2), (2, 3), (3, 4),
+    (0, 5), (5, 6), (6, 7), (7, 8),
+    (9, 10), (10, 11), (11, 12),
+    (13, 14), (14, 15), (15, 16),
+    (0, 17), (17, 18), (18, 19), (19, 20)
+)
+LANDMARK_SCALE = 2.0 # 正規化座標 (0~1) を -1~1 に広げる
+# 描画しない頂点はファークリップ面より奥に置いてクリップさせる
+HIDDEN_POSITION = (0.0, 0.0, -1000.0)
+JOYCON_SIZE = 0.2
+
+def _colors(color, count):
+    return tuple(color) * count
+
+def _cube_vertices(size):
+    """面ごとに4頂点 (24頂点) と、それを2つの三角形にするインデックス"""
+    corners = np.array([
+        (-1, -1, -1), (1, -1, -1), (1, 1, -1), (-1, 1, -1),
+        (-1, -1, 1), (1, -1, 1), (1, 1, 1), (-1, 1, 1),
+    ], dtype=np.float32) * size
+    faces = ((0, 1, 2, 3), (4, 5, 6, 7), (0, 3, 7, 4), (1, 2, 6, 5), (0, 1, 5, 4), (3, 2, 6, 7))
+    vertices = corners[np.array(faces).ravel()]
+    indices = [face * 4 + i for face in range(len(faces)) for i in (0, 1, 2, 0, 2, 3)]
+    return vertices, indices
+
+def _rotation_matrix(roll, pitch, yaw):
+    # imu_fusionのオイラー角と同じZ-Y-Xの順 (R = Rz(yaw) Ry(pitch) Rx(roll))
+    cr, sr = np.cos(roll), np.sin(roll)
+    cp, sp = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    return np.array([
+        [cy * cp, cy * sp * sr - sy * cr, cy * sp * cr + sy * sr],
+        [sy * cp, sy * sp * sr + cy * cr, sy * sp * cr - cy * sr],
+        [-sp, cp * sr, cp * cr],
+    ], dtype=np.float32)
 
 class Visualizer(pyglet.window.Window):
-    def __init__(self, data_queue):
+    def __init__(self, data_mailbox):
         super().__init__(width=800, height=600, caption='VRC_traker 3D Visualizer', resizable=True)
         gl.glClearColor(0.2, 0.3, 0.4, 1.0)
+        gl.glEnable(gl.GL_DEPTH_TEST)
 
-        self.data_queue = data_queue
+        self.data_mailbox = data_mailbox
         self.tracking_data = {} # 最新のトラッキングデータを保持
-
-        gl.glMatrixMode(gl.GL_PROJECTION)
-        gl.glLoadIdentity()
-        gl.gluPerspective(60, self.width / self.height, 0.1, 100.0)
-        gl.glMatrixMode(gl.GL_MODELVIEW)
-        gl.glLoadIdentity()
-        gl.gluLookAt(0, 0, 5, 0, 0, 0, 0, 1, 0)
-
-        gl.glEnable(gl.GL_LIGHTING)
-        gl.glEnable(gl.GL_LIGHT0)
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_POSITION, (gl.GLfloat * 4)(0, 0, 1, 0))
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_AMBIENT, (gl.GLfloat * 4)(0.5, 0.5, 0.5, 1))
-        gl.glLightfv(gl.GL_LIGHT0, gl.GL_DIFFUSE, (gl.GLfloat * 4)(0.8, 0.8, 0.8, 1))
-
-        gl.glEnable(gl.GL_DEPTH_TEST)
+        self.dirty = True # 前回描画してから表示内容が変わったか
+
+        self.view = Mat4.look_at(Vec3(0, 0, 5), Vec3(0, 0, 0), Vec3(0, 1, 0))
+        # on_resizeが来る前に描画しても透視投影になるようにする
+        self.projection = Mat4.perspective_projection(self.width / self.height, 0.1, 100.0, 60)
+
+        # 頂点は最初に一度だけ確保し、新しいデータが届いた時にその場で書き換える
+        self.batch = pyglet.graphics.Batch()
+        program = pyglet.graphics.get_default_shader()
+        # 表示/非表示を切り替える単位ごとにorderの違うGroupにする (同じorderのGroupは1つにまとめられてしまう)。
+        # Groupを指定するとシェーダーは自動でバインドされないので、ShaderGroupを使う
+        self.axes_group = pyglet.graphics.ShaderGroup(program, order=0)
+        self.hand_groups = {"Left": pyglet.graphics.ShaderGroup(program, order=1), "Right": pyglet.graphics.ShaderGroup(program, order=2)}
+        self.pose_group = pyglet.graphics.ShaderGroup(program, order=3)
+        self.joycon_groups = {"Left": pyglet.graphics.ShaderGroup(program, order=4), "Right": pyglet.graphics.ShaderGroup(program, order=5)}
+
+        self.axes = program.vertex_list(
+            6, gl.GL_LINES, batch=self.batch, group=self.axes_group,
+            position=('f', (0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0, 1)),
+            colors=('Bn', (255, 0, 0, 255) * 2 + (0, 255, 0, 255) * 2 + (0, 0, 255, 255) * 2)
+        )
+
+        self.hand_points = {}
+        self.hand_lines = {}
+        for label, group in self.hand_groups.items():
+            self.hand_points[label] = program.vertex_list(
+                21, gl.GL_POINTS, batch=self.batch, group=group,
+                position=('f', HIDDEN_POSITION * 21), colors=('Bn', _colors((255, 255, 0, 255), 21)))
+            self.hand_lines[label] = program.vertex_list(
+                len(HAND_CONNECTIONS) * 2, gl.GL_LINES, batch=self.batch, group=group,
+                position=('f', HIDDEN_POSITION * len(HAND_CONNECTIONS) * 2),
+                colors=('Bn', _colors((0, 255, 255, 255), len(HAND_CONNECTIONS) * 2)))
+            group.visible = False
+
+        self.pose_points = program.vertex_list(
+            33, gl.GL_POINTS, batch=self.batch, group=self.pose_group,
+            position=('f', HIDDEN_POSITION * 33), colors=('Bn', _colors((0, 255, 0, 255), 33)))
+        self.pose_lines = program.vertex_list(
+            len(POSE_CONNECTIONS) * 2, gl.GL_LINES, batch=self.batch, group=self.pose_group,
+            position=('f', HIDDEN_POSITION * len(POSE_CONNECTIONS) * 2),
+            colors=('Bn', _colors((0, 128, 255, 255), len(POSE_CONNECTIONS) * 2)))
+        self.pose_group.visible = False
+
+        # Joy-Conは向きが分かるように面ごとに明るさを変える
+        self.cube_vertices, cube_indices = _cube_vertices(JOYCON_SIZE)
+        shades = np.repeat([1.0, 0.55, 0.8, 0.7, 0.9, 0.6], 4)[:, None]
+        self.joycons = {}
+        self.joycon_offsets = {"Left": np.array([-0.5, 0.0, 0.0], dtype=np.float32), "Right": np.array([0.5, 0.0, 0.0], dtype=np.float32)}
+        for label, color in (("Left", (0, 0, 255)), ("Right", (255, 0, 0))):
+            face_colors = np.hstack([np.array(color) * shades, np.full((24, 1), 255)]).astype(np.uint8)
+            self.joycons[label] = program.vertex_list_indexed(
+                24, gl.GL_TRIANGLES, cube_indices, batch=self.batch, group=self.joycon_groups[label],
+                position=('f', (self.cube_vertices + self.joycon_offsets[label]).ravel().tolist()),
+                colors=('Bn', face_colors.ravel().tolist()))
+            self.joycon_groups[label].visible = False
+
+        # 最後に頂点に書き込んだデータ (同じデータなら書き換えない)
+        self.drawn = {}
 
         pyglet.clock.schedule_interval(self.update, 1/60.0)
 
-        # MediaPipe Poseの接続定義
-        self.mp_pose = mp.solutions.pose
+    def on_resize(self, width, height):
+        gl.glViewport(0, 0, *self.get_framebuffer_size())
+        self.projection = Mat4.perspective_projection(width / max(height, 1), 0.1, 100.0, 60)
+        self.dirty = True
+        return pyglet.event.EVENT_HANDLED
+
+    def on_expose(self):
+        self.dirty = True
 
     def on_draw(self):
         self.clear()
-        gl.glLoadIdentity()
-        gl.gluLookAt(0, 0, 5, 0, 0, 0, 0, 1, 0)
-
-        self.draw_axes()
-
-        if self.tracking_data:
-            if "hand_landmarks" in self.tracking_data:
-                self.draw_hands(self.tracking_data["hand_landmarks"])
-            
-            if "joycon_orientations" in self.tracking_data:
-                self.draw_joycons(self.tracking_data["joycon_orientations"])
-
-            if "pose_landmarks" in self.tracking_data:
-                self.draw_pose(self.tracking_data["pose_landmarks"])
-
-    def draw_axes(self):
-        gl.glBegin(gl.GL_LINES)
-        gl.glColor3f(1.0, 0.0, 0.0)
-        gl.glVertex3f(0.0, 0.0, 0.0)
-        gl.glVertex3f(1.0, 0.0, 0.0)
-        gl.glColor3f(0.0, 1.0, 0.0)
-        gl.glVertex3f(0.0, 0.0, 0.0)
-        gl.glVertex3f(0.0, 1.0, 0.0)
-        gl.glColor3f(0.0, 0.0, 1.0)
-        gl.glVertex3f(0.0, 0.0, 0.0)
-        gl.glVertex3f(0.0, 0.0, 1.0)
-        gl.glEnd()
-
-    def draw_hands(self, hand_landmarks_data):
-        scale = 2.0
-
-        for hand_type, landmarks in hand_landmarks_data.items():
-            gl.glColor3f(1.0, 1.0, 0.0)
-            gl.glPointSize(5.0)
-            gl.glBegin(gl.GL_POINTS)
-            for lm in landmarks:
-                gl.glVertex3f(lm.x * scale - scale/2, lm.y * scale - scale/2, lm.z * scale - scale/2)
-            gl.glEnd()
-
-            connections = [
-                (0, 1), (1, 2), (2, 3), (3, 4),
-                (0, 5), (5, 6), (6, 7), (7, 8),
-                (9, 10), (10, 11), (11, 12),
-                (13, 14), (14, 15), (15, 16),
-                (0, 17), (17, 18), (18, 19), (19, 20)
-            ]
-            gl.glColor3f(0.0, 1.0, 1.0)
-            gl.glLineWidth(2.0)
-            gl.glBegin(gl.GL_LINES)
-            for connection in connections:
-                p1 = landmarks[connection[0]]
-                p2 = landmarks[connection[1]]
-                gl.glVertex3f(p1.x * scale - scale/2, p1.y * scale - scale/2, p1.z * scale - scale/2)
-                gl.glVertex3f(p2.x * scale - scale/2, p2.y * scale - scale/2, p2.z * scale - scale/2)
-            gl.glEnd()
-
-    def draw_joycons(self, joycon_orientations):
-        size = 0.2
-
-        for jc_type, orientation in joycon_orientations.items():
-            gl.glPushMatrix()
-            
-            if jc_type == "Left":
-                gl.glTranslatef(-0.5, 0.0, 0.0)
-                gl.glColor3f(0.0, 0.0, 1.0)
-            else:
-                gl.glTranslatef(0.5, 0.0, 0.0)
-                gl.glColor3f(1.0, 0.0, 0.0)
-
-            gl.glRotatef(math.degrees(orientation[0]), 1, 0, 0)
-            gl.glRotatef(math.degrees(orientation[1]), 0, 1, 0)
-            gl.glRotatef(math.degrees(orientation[2]), 0, 0, 1)
-
-            vertices = [
-                (-size, -size, -size), ( size, -size, -size), ( size,  size, -size), (-size,  size, -size),
-                (-size, -size,  size), ( size, -size,  size), ( size,  size,  size), (-size,  size,  size)
-            ]
-            faces = [
-                (0, 1, 2, 3), (4, 5, 6, 7),
-                (0, 3, 7, 4), (1, 2, 6, 5),
-                (0, 1, 5, 4), (3, 2, 6, 7)
-            ]
-
-            gl.glBegin(gl.GL_QUADS)
-            for face in faces:
-                for vertex_idx in face:
-                    gl.glVertex3f(*vertices[vertex_idx])
-            gl.glEnd()
-
-            gl.glPopMatrix()
-
-    def draw_pose(self, pose_landmarks):
-        scale = 2.0 # スケールファクター
-
-        gl.glColor3f(0.0, 1.0, 0.0) # 緑色でポーズを描画
         gl.glPointSize(5.0)
-        gl.glBegin(gl.GL_POINTS)
-        for lm in pose_landmarks:
-            # 可視性スコアが低いランドマークは描画しない
-            if lm.visibility > 0.5:
-                gl.glVertex3f(lm.x * scale - scale/2, lm.y * scale - scale/2, lm.z * scale - scale/2)
-        gl.glEnd()
-
-        gl.glColor3f(0.0, 0.5, 1.0) # 水色でポーズの接続を描画
-        gl.glLineWidth(2.0)
-        gl.glBegin(gl.GL_LINES)
-        for connection in self.mp_pose.POSE_CONNECTIONS:
-            p1 = pose_landmarks[connection[0]]
-            p2 = pose_landmarks[connection[1]]
-            # 両方のランドマークの可視性スコアが高い場合のみ描画
-            if p1.visibility > 0.5 and p2.visibility > 0.5:
-                gl.glVertex3f(p1.x * scale - scale/2, p1.y * scale - scale/2, p1.z * scale - scale/2)
-                gl.glVertex3f(p2.x * scale - scale/2, p2.y * scale - scale/2, p2.z * scale - scale/2)
-        gl.glEnd()
+        self.batch.draw()
+
+    def _set_visible(self, group, visible):
+        # Groupのvisibleを変えるとバッチの描画リストが作り直されるので、変わった時だけ設定する
+        if group.visible == visible:
+            return False
+        group.visible = visible
+        return True
+
+    def _update_hands(self, hand_landmarks_data):
+        changed = False
+        for label, group in self.hand_groups.items():
+            landmarks = hand_landmarks_data.get(label)
+            changed |= self._set_visible(group, landmarks is not None)
+            # 推論を省略したフレームでは前回と同じ配列が届くので、書き換えない
+            if landmarks is None or self.drawn.get(("hand", label)) is landmarks:
+                continue
+            # landmarksは (21, 3) の配列
+            points = np.asarray(landmarks, dtype=np.float32) * LANDMARK_SCALE - LANDMARK_SCALE / 2
+            self.hand_points[label].position = points.ravel().tolist()
+            self.hand_lines[label].position = points[np.array(HAND_CONNECTIONS)].ravel().tolist()
+            self.drawn[("hand", label)] = landmarks
+            changed = True
+        return changed
+
+    def _update_pose(self, pose_landmarks):
+        changed = self._set_visible(self.pose_group, pose_landmarks is not None)
+        if pose_landmarks is None or self.drawn.get("pose") is pose_landmarks:
+            return changed
+        # pose_landmarksは (33, 4) の配列 (x, y, z, visibility)。可視性スコアが低いランドマークは描画しない
+        points = pose_landmarks[:, :3].astype(np.float32) * LANDMARK_SCALE - LANDMARK_SCALE / 2
+        visible = pose_landmarks[:, 3] > 0.5
+        points[~visible] = HIDDEN_POSITION
+        connections = np.array(POSE_CONNECTIONS)
+        # 両方のランドマークの可視性スコアが高い接続だけ描画する
+        lines = points[connections]
+        lines[~visible[connections].all(axis=1)] = HIDDEN_POSITION
+        self.pose_points.position = points.ravel().tolist()
+        self.pose_lines.position = lines.ravel().tolist()
+        self.drawn["pose"] = pose_landmarks
+        return True
+
+    def _update_joycons(self, joycon_orientations):
+        changed = False
+        for label, group in self.joycon_groups.items():
+            orientation = joycon_orientations.get(label)
+            changed |= self._set_visible(group, orientation is not None)
+            if orientation is None or self.drawn.get(("joycon", label)) == orientation:
+                continue
+            # 姿勢が変わった時だけ、回転させた24頂点をCPUで計算して書き込む
+            vertices = self.cube_vertices @ _rotation_matrix(*orientation).T + self.joycon_offsets[label]
+            self.joycons[label].position = vertices.ravel().tolist()
+            self.drawn[("joycon", label)] = orientation
+            changed = True
+        return changed
 
     def update(self, dt):
-        try:
-            while True:
-                data = self.data_queue.get_nowait()
-                if data["type"] == "VISUALIZER_DATA":
-                    self.tracking_data = data["data"]
-        except queue.Empty:
-            pass
+        # 描画より速く届いたデータは上書きされているので、最新のものだけを受け取る
+        data = self.data_mailbox.take().get("data")
+        if data is not None:
+            self.tracking_data = data
+            # すべて評価する (短絡させると後ろの更新が行われない)
+            changed = [
+                self._update_hands(data.get("hand_landmarks", {})),
+                self._update_pose(data.get("pose_landmarks")),
+                self._update_joycons(data.get("joycon_orientations", {})),
+            ]
+            if any(changed):
+                self.dirty = True
+
+        # 新しいデータもウィンドウの変化も無ければ描画しない
+        if self.dirty:
+            self.dirty = False
+            self.draw(dt)
 
     def run(self):
-        pyglet.app.run()
+        # 描画はupdateで必要な時だけ行うので、pygletに定期的な再描画はさせない
+        pyglet.app.run(None)
 
     def close(self):
         pyglet.app.exit()
         super().close()
 
 class VisualizerThread(threading.Thread):
-    def __init__(self, data_queue):
+    def __init__(self, data_mailbox):
         super().__init__()
-        self.data_queue = data_queue
+        self.data_mailbox = data_mailbox
         self.visualizer = None
         self.daemon = True
 
     def run(self):
-        self.visualizer = Visualizer(self.data_queue)
+        self.visualizer = Visualizer(self.data_mailbox)
         self.visualizer.run()
 
     def stop(self):